@@ -1,136 +1,370 @@
 import time
 import json
-import torch
-import torchaudio
 import os
-import pyaudio
 import numpy as np
-import whisper
-from piper.voice import PiperVoice
-import sounddevice as sd
-from openai import OpenAI
+from raspberry.bootstrap import Bootstrap, BootError
+from raspberry.playback import PlaybackEngine
+from raspberry.phrase_cache import PhraseCache
+from raspberry.capture import CaptureEngine
+from raspberry.asr import make_asr, vocabulary_prompt, IncrementalTranscriber, segments_text
+from raspberry.answer_match import match_answer, report
+from raspberry.prefetch import Prefetch
+from raspberry.synthesis import render
+from raspberry.llm import OllamaSession
+from raspberry.student_profile import StudentProfile
+from raspberry.lesson_pool import LessonPool, lesson_prompt, validate_lesson
+from raspberry.audio_bundle import AudioBundle, install_bundle
+from raspberry.lesson_store import LessonStore
+from raspberry.retrieval import Retriever
 import random
+import re
+import queue
+import threading
 import requests
 
-
-client = OpenAI(
-    api_key= "",
-)
-
-url = "http://localhost:11434/api/generate"
-headers = {
-    "Content-Type": "application/json"
-}
-
-
-def llm_response(prompt):
-    data = {
-        "model": "cas/llama-3.2-1b-instruct",
-        "prompt": prompt,
-        "stream": False
-    }
-    response = requests.post(url, headers=headers, data=json.dumps(data))
-    if response.status_code == 200:
-        rez = response.text
-        data = json.loads(rez)
-        val = data['response']
-        return val
-    else:
-        print("Error", response.status_code, response.text)
+boot = Bootstrap()
+
+OLLAMA_MODEL = "cas/llama-3.2-1b-instruct"
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# One pooled client for the whole session; see raspberry/llm.py.
+llm = OllamaSession(OLLAMA_MODEL, keep_alive=OLLAMA_KEEP_ALIVE)
+
+
+LECTURE_WELCOME = "Hi there! I'm your learning buddy. Today we're going to learn about physics. Lets start the lesson?"
+LECTURE_GOODBYE = "Thanks for learning with me today! Goodbye!"
+LECTURE_NOT_HEARD = "I didn't hear your answer. Could you please try again?"
+LECTURE_COMPLETE = "Congratulations! You've completed all the questions for this lesson. You did a great job learning about physics!"
+LECTURE_NEXT = "Let's move to the next question!"
+LANGUAGE_WELCOME = "Hello! I'm your English practice buddy. We'll have fun conversations together to help you learn. Let's start!"
+LANGUAGE_GOODBYE = "Thanks for practicing English with me today! Goodbye!"
+LANGUAGE_NOT_HEARD = "I didn't hear you. Could you please try again?"
+LANGUAGE_NEXT = "Let's try something new now!"
+ERROR_MESSAGE = "I'm having some trouble. Let's try again."
+CORRECT_TEMPLATE = "Great job! That's correct. {answer}"
+PARTLY_CORRECT_TEMPLATE = "That's partly right! The complete answer is: {answer}"
+
+FIXED_PHRASES = [
+    LECTURE_WELCOME, LECTURE_GOODBYE, LECTURE_NOT_HEARD, LECTURE_COMPLETE, LECTURE_NEXT,
+    LANGUAGE_WELCOME, LANGUAGE_GOODBYE, LANGUAGE_NOT_HEARD, LANGUAGE_NEXT, ERROR_MESSAGE,
+]
+
+def llm_response(prompt, system=None, profile=None):
+    """
+    `system` carries the fixed instructions so Ollama can reuse its cached
+    prefill across turns; per-question context belongs in `prompt`.
+    """
+    try:
+        return llm.chat(prompt, system=system, profile=profile)
+    except requests.HTTPError as e:
+        print("Error", e.response.status_code, e.response.text)
         return "Error generating response"
 
-print('starting model loading')
-model = whisper.load_model("base.en")  
-print('finished model loading')
+def llm_stream(prompt, system=None, profile=None, stop=None):
+    """Yields response fragments from Ollama's NDJSON stream as tokens are generated."""
+    try:
+        yield from llm.stream(prompt, system=system, profile=profile, stop=stop)
+    except requests.HTTPError as e:
+        print("Error", e.response.status_code, e.response.text)
+        yield "Error generating response"
+
+# A sentence ends at . ! ? (plus closing quotes/brackets) once whitespace follows, or at a newline.
+SENTENCE_BOUNDARY = re.compile(r'[.!?]+["\')\]]*(?=\s)|\n')
+ABBREVIATIONS = ("mr.", "mrs.", "ms.", "dr.", "e.g.", "i.e.", "etc.", "vs.")
+MIN_SENTENCE_CHARS = 12
+
+def split_sentences(fragments, min_chars=MIN_SENTENCE_CHARS):
+    """Regroups streamed text fragments into sentences as soon as each one is complete."""
+    buffer = ""
+    for fragment in fragments:
+        buffer += fragment
+        start = 0
+        for match in SENTENCE_BOUNDARY.finditer(buffer):
+            candidate = buffer[start:match.end()].strip()
+            if len(candidate) < min_chars or candidate.lower().endswith(ABBREVIATIONS):
+                continue
+            yield candidate
+            start = match.end()
+        buffer = buffer[start:]
+    if buffer.strip():
+        yield buffer.strip()
+
+def stream_sentences(prompt, fallback="I'm having trouble answering right now.", system=None, profile=None,
+                     stop=None):
+    """
+    Generates in a background thread so Ollama keeps producing tokens while
+    earlier sentences are being synthesized and played. Setting the `stop`
+    event ends the generation.
+    """
+    sentences = queue.Queue()
+    done = object()
+
+    def produce():
+        produced = False
+        try:
+            for sentence in split_sentences(llm_stream(prompt, system=system, profile=profile, stop=stop)):
+                produced = True
+                sentences.put(sentence)
+        except Exception as e:
+            print(f"Error streaming LLM response: {e}")
+            if not produced:
+                sentences.put(fallback)
+        finally:
+            sentences.put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        sentence = sentences.get()
+        if sentence is done:
+            return
+        yield sentence
+
+HEADER_OBJECT = re.compile(r'\{.*?\}', re.DOTALL)
+MAX_HEADER_CHARS = 600
+FENCE_CHARS = "`-\r\n "
+
+def _parse_header(text, default):
+    header = dict(default)
+    match = HEADER_OBJECT.search(text)
+    if match:
+        try:
+            header.update(json.loads(match.group(0)))
+        except json.JSONDecodeError:
+            print(f"Error parsing reply header: {match.group(0)}")
+    return header
+
+def stream_verdict_and_sentences(prompt, default_header, fallback, system=None, profile=None):
+    """
+    Runs one streamed LLM call whose reply starts with a JSON object (the verdict)
+    followed by text to speak. Returns (header, sentences, cancel) as soon as the
+    header is complete; sentences keep streaming in the background. Iterating
+    `sentences` yields `fallback` if the reply had no text after the header, and
+    `cancel()` stops generation when the text will not be spoken.
+    """
+    header = {"value": dict(default_header)}
+    header_ready = threading.Event()
+    stopped = threading.Event()
+    sentences = queue.Queue()
+    done = object()
+
+    def body_fragments():
+        buffer = ""
+        in_header = True
+        for fragment in llm_stream(prompt, system=system, profile=profile, stop=stopped):
+            if stopped.is_set():
+                return
+            if not in_header:
+                yield fragment
+                continue
+            buffer += fragment
+            end = buffer.find("}")
+            # Wait for the first spoken character so a closing code fence is not read aloud.
+            if end < 0 or not buffer[end + 1:].lstrip(FENCE_CHARS):
+                if len(buffer) < MAX_HEADER_CHARS:
+                    continue
+                end = -1
+            header["value"] = _parse_header(buffer[:end + 1], default_header)
+            header_ready.set()
+            in_header = False
+            yield buffer[end + 1:].lstrip(FENCE_CHARS)
+        if in_header:
+            header["value"] = _parse_header(buffer, default_header)
+            end = buffer.find("}")
+            # Small models often skip the header: then the whole reply is the text to speak.
+            body = buffer[end + 1:] if end >= 0 else buffer
+            yield body.strip(FENCE_CHARS)
+
+    def produce():
+        try:
+            for sentence in split_sentences(body_fragments()):
+                sentences.put(sentence)
+        except Exception as e:
+            print(f"Error streaming LLM response: {e}")
+        finally:
+            header_ready.set()
+            sentences.put(done)
+
+    def spoken():
+        produced = False
+        while True:
+            sentence = sentences.get()
+            if sentence is done:
+                break
+            produced = True
+            yield sentence
+        if not produced:
+            yield fallback
+
+    threading.Thread(target=produce, daemon=True).start()
+    header_ready.wait()
+    return header["value"], spoken(), stopped.set
+
+ASR_BACKEND = os.getenv("ASR_BACKEND", "faster-whisper")
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+# Upper bound on the textbook context put into one prompt, in characters.
+RETRIEVAL_MAX_CHARS = int(os.getenv("RETRIEVAL_MAX_CHARS", "1200"))
+API_BASE = os.getenv("API_BASE", "https://chatbot-backend-iskc.onrender.com")
+DIALOGS_URL = f"{API_BASE}/api/get-json-dialogs"
 
 voicedir = os.path.expanduser('/home/user/Desktop/sp_chatbot/')  
 model11 = os.path.join(voicedir, "en_US-kathleen-low.onnx")  
-voice = PiperVoice.load(model11)
-
-chunk = 1024
-sample_format = pyaudio.paInt16  
-channels = 2  
-fs = 44100 
+TTS_CACHE_DIR = os.path.expanduser("~/.cache/sp_chatbot/tts")
+PROFILE_PATH = os.path.expanduser("~/.cache/sp_chatbot/student_profile.json")
+BUNDLE_DIR = os.path.expanduser("~/.cache/sp_chatbot/bundles")
+LESSON_STORE_PATH = os.path.expanduser("~/.cache/sp_chatbot/lessons.db")
+
+lesson_store = LessonStore(LESSON_STORE_PATH)
+
+# Filled in by the boot tasks below; wait on the task before using them.
+asr = None
+voice = None
+player = None
+phrase_cache = None
+mic = None
+
+def load_asr():
+    global asr
+    asr = make_asr(ASR_BACKEND, "base.en")
+    # The first inference pays one-off allocations, do it before the child speaks.
+    asr.transcribe(np.zeros(16000, dtype=np.float32))
+
+def load_tts():
+    global voice, player, phrase_cache
+    from piper.voice import PiperVoice
+    voice = PiperVoice.load(model11)
+    render(voice, "Hello.")
+    phrase_cache = PhraseCache(TTS_CACHE_DIR, voice_id=os.path.basename(model11))
+    phrase_cache.warm_up(voice, [LECTURE_WELCOME, LANGUAGE_WELCOME])
+    player = PlaybackEngine(voice)
+
+def open_mic():
+    global mic
+    mic = CaptureEngine()
+
+def sync_dialogs():
+    """Brings the local lesson store up to date; only changed sections are downloaded."""
+    headers = {"If-None-Match": lesson_store.etag} if lesson_store.etag else {}
+    params = {"have": ",".join(lesson_store.section_versions())}
+    response = requests.get(DIALOGS_URL, params=params, headers=headers, timeout=60)
+    if response.status_code == 304:
+        print("[Sync] Lessons are up to date")
+        return lesson_store.load()
+    response.raise_for_status()
+    return lesson_store.apply(response.json(), response.headers.get("ETag"))
+
+def load_audio_bundle(info):
+    """Downloads a section's server-rendered audio bundle (once per version) and attaches it to the phrase cache."""
+    path = os.path.join(BUNDLE_DIR, f"{info['version']}.bin")
+    if not os.path.exists(path):
+        response = requests.get(f"{API_BASE}{info['url']}", timeout=60)
+        response.raise_for_status()
+        install_bundle(response.content, path)
+    phrase_cache.attach_bundle(AudioBundle(path))
+
+def preload_llm():
+    """Asks Ollama to load the model now and keep it resident, so the first turn skips the load."""
+    llm.preload()
+
+def start_boot():
+    boot.start("tts", load_tts)
+    boot.start("dialogs", sync_dialogs)
+    boot.start("llm", preload_llm)
+    boot.start("asr", load_asr)
+    boot.start("mic", open_mic)
+
+
+FALLBACK_LESSON = {
+    "title": "Basic English Greetings",
+    "level": "Beginner",
+    "conversations": [
+        {
+            "prompt": "Let's practice saying hello. How would you greet someone in the morning?",
+            "expected_responses": ["Good morning", "Hello", "Hi"],
+            "follow_up": "Great! 'Good morning' is a perfect greeting for the morning. Can you also say 'Hello' or 'Hi'?"
+        },
+        {
+            "prompt": "Now let's practice introducing yourself. Say: 'My name is...' and add your name.",
+            "expected_responses": ["My name is", "I am", "I'm"],
+            "follow_up": "Excellent! That's how we introduce ourselves in English."
+        },
+        {
+            "prompt": "How would you ask someone their name?",
+            "expected_responses": ["What is your name", "What's your name"],
+            "follow_up": "Perfect! 'What is your name?' or 'What's your name?' is how we ask someone's name."
+        },
+        {
+            "prompt": "Let's practice saying goodbye. How would you say goodbye to someone?",
+            "expected_responses": ["Goodbye", "Bye", "See you later", "See you soon"],
+            "follow_up": "Excellent! Those are all great ways to say goodbye in English."
+        }
+    ]
+}
 
+LANGUAGE_LEVELS = ["Beginner", "Elementary"]
+# Lessons kept per (prompt, level) so repeat sessions rotate through validated content.
+LESSON_POOL_TARGET = 3
+lesson_pool = LessonPool(os.path.expanduser("~/.cache/sp_chatbot/lessons.json"))
 
-def load_language_learning_content(parent_prompt):
+def generate_language_lesson(parent_prompt, level):
+    """Writes a lesson with the local model; returns it validated, or None."""
+    response = llm_response(lesson_prompt(parent_prompt, level), profile="lesson")
     try:
-        language_levels = ["Beginner", "Elementary"]
-        
-        selected_level = random.choice(language_levels)
-        
-        system_prompt = f"You are an expert English language curriculum designer. Create an engaging conversational English lesson appropriate for a non-English speaker on the topic of {parent_prompt}."
-        user_prompt = f"Create a short English conversation practice lesson for {selected_level} level students. The lesson should focus on practical, everyday English conversation skills. Format the response as a JSON object with the following structure:\n\n{{\"title\": \"Lesson title\", \"level\": \"{selected_level}\", \"conversations\": [{{\"prompt\": \"Question or instruction for student\", \"expected_responses\": [\"possible response 1\", \"possible response 2\"], \"follow_up\": \"Encouraging feedback and additional information\"}}]}}"
+        return validate_lesson(json.loads(response), level)
+    except json.JSONDecodeError:
+        print("Failed to parse JSON response from Ollama.")
+        return None
+
+def load_language_learning_content(parent_prompt, server_lessons=()):
+    """
+    Returns the lesson for this session: the next pooled lesson (pre-generated by
+    the server or by an earlier session) if there is one, otherwise one written
+    live by the local model, otherwise the built-in greetings lesson.
+    """
+    try:
+        for lesson in server_lessons or []:
+            lesson_pool.add(parent_prompt, lesson.get("level") or LANGUAGE_LEVELS[0], lesson)
         
-        full_prompt = f"{system_prompt}\n\n{user_prompt}"
-        response = llm_response(full_prompt)
+        levels = random.sample(LANGUAGE_LEVELS, len(LANGUAGE_LEVELS))
+        for level in levels:
+            lesson = lesson_pool.take(parent_prompt, level)
+            if lesson is not None:
+                print(f"Using pooled {level} lesson ({lesson_pool.count(parent_prompt, level)} in pool)")
+                return [lesson]
         
-        try:
-            lesson_data = json.loads(response)
-            return [lesson_data]
-        except json.JSONDecodeError:
-            print("Failed to parse JSON response from Ollama. Using fallback content.")
-            return [{
-                "title": "Basic English Greetings",
-                "level": "Beginner",
-                "conversations": [
-                    {
-                        "prompt": "Let's practice saying hello. How would you greet someone in the morning?",
-                        "expected_responses": ["Good morning", "Hello", "Hi"],
-                        "follow_up": "Great! 'Good morning' is a perfect greeting for the morning. Can you also say 'Hello' or 'Hi'?"
-                    },
-                    {
-                        "prompt": "Now let's practice introducing yourself. Say: 'My name is...' and add your name.",
-                        "expected_responses": ["My name is", "I am", "I'm"],
-                        "follow_up": "Excellent! That's how we introduce ourselves in English."
-                    },
-                    {
-                        "prompt": "How would you ask someone their name?",
-                        "expected_responses": ["What is your name", "What's your name"],
-                        "follow_up": "Perfect! 'What is your name?' or 'What's your name?' is how we ask someone's name."
-                    },
-                    {
-                        "prompt": "Let's practice saying goodbye. How would you say goodbye to someone?",
-                        "expected_responses": ["Goodbye", "Bye", "See you later", "See you soon"],
-                        "follow_up": "Excellent! Those are all great ways to say goodbye in English."
-                    }
-                ]
-            }]
+        lesson = generate_language_lesson(parent_prompt, levels[0])
+        if lesson is not None:
+            lesson_pool.add(parent_prompt, levels[0], lesson)
+            return [lesson]
+        print("Generated lesson was not usable. Using fallback content.")
     except Exception as e:
         print(f"Error generating language learning content: {e}")
-        return [{
-            "title": "Basic English Greetings",
-            "level": "Beginner",
-            "conversations": [
-                {
-                    "prompt": "Let's practice saying hello. How would you greet someone in the morning?",
-                    "expected_responses": ["Good morning", "Hello", "Hi"],
-                    "follow_up": "Great! 'Good morning' is a perfect greeting for the morning. Can you also say 'Hello' or 'Hi'?"
-                },
-                {
-                    "prompt": "Now let's practice introducing yourself. Say: 'My name is...' and add your name.",
-                    "expected_responses": ["My name is", "I am", "I'm"],
-                    "follow_up": "Excellent! That's how we introduce ourselves in English."
-                },
-                {
-                    "prompt": "How would you ask someone their name?",
-                    "expected_responses": ["What is your name", "What's your name"],
-                    "follow_up": "Perfect! 'What is your name?' or 'What's your name?' is how we ask someone's name."
-                },
-                {
-                    "prompt": "Let's practice saying goodbye. How would you say goodbye to someone?",
-                    "expected_responses": ["Goodbye", "Bye", "See you later", "See you soon"],
-                    "follow_up": "Excellent! Those are all great ways to say goodbye in English."
-                }
-            ]
-        }]
-
-def get_system_prompt(context):
-    return f"""You are an educational assistant for children. You're teaching concepts from textbooks.
+    return [FALLBACK_LESSON]
+
+def refill_lesson_pool(parent_prompt):
+    """
+    Writes one more lesson for the emptiest level. Runs after the session, when the
+    local model is otherwise idle, so the next session starts from the pool.
+    """
+    level = min(LANGUAGE_LEVELS, key=lambda name: lesson_pool.count(parent_prompt, name))
+    if lesson_pool.count(parent_prompt, level) >= LESSON_POOL_TARGET:
+        return
+    started = time.perf_counter()
+    try:
+        lesson = generate_language_lesson(parent_prompt, level)
+    except Exception as e:
+        print(f"Error pre-generating lesson: {e}")
+        return
+    if lesson is not None and lesson_pool.add(parent_prompt, level, lesson):
+        print(f"Added a {level} lesson to the pool in {time.perf_counter() - started:.1f}s")
+
+def get_system_prompt():
+    return """You are an educational assistant for children. You're teaching concepts from textbooks.
 Your goal is to help kids learn and understand new concepts. 
 Keep explanations simple, engaging, and at a level appropriate for a 7-10 year old child.
-The following is the context from the textbook that you should use as reference:
-{context}"""
+Use the textbook context given with each request as your reference."""
+
+def with_context(prompt, context):
+    # The context changes with every question, so it goes in the user turn and the system prefix stays cached.
+    return f"Textbook context:\n{context}\n\n{prompt}"
 
 def get_language_learning_prompt():
     return """You are an English language tutor for children who are learning English as a second language.
@@ -143,66 +377,106 @@ Notice their interests based on their responses and incorporate those topics whe
 Always be encouraging, patient, and responsive to their unique communication style.
 Remember that learning should be fun and engaging for children."""
 
-def evaluate_answer(student_answer, correct_answer, question):
-    prompt = f"You are an educational assessment assistant. Your task is to evaluate if a student's answer is correct, partially correct, or incorrect compared to the expected answer. Return 'correct', 'partially_correct', or 'incorrect'.\n\nQuestion: {question}\nExpected answer: {correct_answer}\nStudent answer: {student_answer}\n\nEvaluate if the student's answer is correct, partially correct, or incorrect."
-    
+def evaluate_and_hint(student_answer, correct_answer, question, context, hint=None):
+    """
+    Evaluates an answer and prepares the spoken hint in one LLM call. Returns
+    (evaluation, hint, cancel); call `cancel()` when the hint is not going to be
+    spoken. `hint` is the precomputed hint for this attempt, used when the answer
+    is decided locally and returned as is (a fixed phrase, spoken from the phrase
+    cache); otherwise the hint is a sentence stream, and off-script answers get a
+    live hint tailored to what the child said.
+    """
+    verdict, decision = match_answer(student_answer, [correct_answer])
+    if verdict:
+        report(student_answer, verdict, decision)
+        if hint:
+            return verdict, hint, lambda: None
+        hint = generate_explanation(context, question, correct_answer, student_answer, is_initial=False, stream=True)
+        return verdict, hint, lambda: None
+
+    prompt = f"""You are an educational assistant for children aged 7-10. Evaluate the student's answer and help them if needed, using the textbook context above.
+
+Question: {question}
+Expected answer: {correct_answer}
+Student answer: {student_answer}
+
+On the first line write only a JSON object: {{"evaluation": "correct" or "partially_correct" or "incorrect"}}
+If the evaluation is not "correct", continue on the next line with a very brief, encouraging hint (1-2 sentences) that guides the student toward the correct answer, and end the hint by asking the question again. If it is "correct", write nothing after the JSON line."""
+    fallback = f"Let's think about it together once more. {question}"
     try:
-        evaluation = llm_response(prompt).lower()
-        
-        if "correct" in evaluation and "incorrect" not in evaluation:
-            return "correct"
-        elif "partially" in evaluation or "partial" in evaluation:
-            return "partially_correct"
-        else:
-            return "incorrect"
+        header, hint, cancel = stream_verdict_and_sentences(with_context(prompt, context), {"evaluation": "incorrect"},
+                                                            fallback, system=get_system_prompt(), profile="evaluate")
     except Exception as e:
         print(f"Error evaluating answer: {e}")
-        return "error"
-
-def evaluate_language_response(student_response, expected_responses, previous_responses=None):
-    prompt = f"""You are an English language assessment assistant for children. 
-Your task is to evaluate if a child's response shows understanding of the question and contains appropriate vocabulary, 
-even if it doesn't exactly match expected phrases. Consider their language development level.
-Return a JSON with:
-{{
-  "evaluation": "correct" or "partially_correct" or "incorrect",
-  "language_level": "beginner" or "elementary" or "intermediate",
-  "interests": ["topic1", "topic2"],
-  "feedback_focus": "vocabulary" or "grammar" or "pronunciation" or "confidence"
-}}
+        return "error", iter([fallback]), lambda: None
+    evaluation = str(header.get("evaluation", "incorrect")).lower()
+    if evaluation not in ("correct", "partially_correct", "incorrect"):
+        evaluation = "partially_correct" if "partial" in evaluation else "incorrect"
+    report(student_answer, evaluation, decision)
+    return evaluation, hint, cancel
+
+def evaluate_and_respond(student_response, prompt, expected_responses, follow_up, student_profile):
+    """
+    Evaluates a conversation answer and streams the spoken feedback from the
+    same LLM call. Returns (result, feedback_sentences) where result holds the
+    evaluation and the profile fields the model inferred.
+    """
+    # Conversation answers may be right without sharing words with the examples,
+    # so only confident matches are decided locally; everything else goes to the LLM.
+    verdict, decision = match_answer(student_response, expected_responses, incorrect_threshold=-1)
+    if verdict:
+        report(student_response, verdict, decision)
+        feedback = generate_language_feedback(follow_up, expected_responses, student_response, is_initial=False,
+                                              student_profile=student_profile, stream=True)
+        return {"evaluation": verdict, "decision": "local"}, feedback
+
+    llm_prompt = f"""You are an English language tutor for children who are learning English as a second language.
+Evaluate whether the child's response shows understanding of the prompt and uses appropriate vocabulary, even if it doesn't exactly match the expected phrases, and then reply to the child.
 
+Prompt given: {prompt}
 Expected content: {expected_responses}
-Student response: {student_response}
-Previous responses: {previous_responses if previous_responses else 'None'}
-
-Evaluate if the student's response shows understanding and provide language assessment details."""
-    
+Follow-up information: {follow_up}
+Student's response: {student_response}
+Student profile: {student_profile.prompt_text() if student_profile else 'New student'}
+
+On the first line write only a JSON object:
+{{"evaluation": "correct" or "partially_correct" or "incorrect", "language_level": "beginner" or "elementary" or "intermediate", "interests": ["topic1", "topic2"], "feedback_focus": "vocabulary" or "grammar" or "pronunciation" or "confidence"}}
+Then, on the next lines, speak to the child: adapt to their language level, use their interests when possible, model correct language naturally instead of just correcting, and be warm and encouraging. If the response is correct or partially correct, build on the follow-up information. If it is incorrect, gently help and ask the prompt again."""
+    default = {"evaluation": "error", "language_level": student_profile.language_level,
+               "interests": [], "feedback_focus": student_profile.feedback_focus}
+    fallback = f"Good try! Let's try again. {prompt}"
     try:
-        result = llm_response(prompt)
-        try:
-            return json.loads(result)
-        except json.JSONDecodeError:
-            print(f"Error parsing JSON from Ollama response: {result}")
-            return {"evaluation": "error", "language_level": "beginner", "interests": [], "feedback_focus": "vocabulary"}
+        result, feedback, _ = stream_verdict_and_sentences(llm_prompt, default, fallback,
+                                                           system=get_language_learning_prompt(), profile="evaluate")
     except Exception as e:
         print(f"Error evaluating language response: {e}")
-        return {"evaluation": "error", "language_level": "beginner", "interests": [], "feedback_focus": "vocabulary"}
+        return default, iter([fallback])
+    report(student_response, result.get("evaluation"), decision)
+    result["decision"] = "llm"
+    return result, feedback
 
-def generate_explanation(context, question, correct_answer, student_answer=None, is_initial=True):
+def generate_explanation(context, question, correct_answer, student_answer=None, is_initial=True, stream=False,
+                         stop=None):
     if is_initial:
-        prompt = f"You are an educational assistant for children. Your task is to explain a concept from a textbook before asking a question. Make the explanation engaging, interactive, and appropriate for a 7-10 year old.\n\nContext from textbook: {context}\n\nI'm about to ask this question: {question}\n\nProvide a very brief, engaging explanation (2-3 sentences max) that will help a child understand just the key concept needed to answer this question. Keep it simple, conversational, and interactive - like you're talking directly to the child. End your explanation with the question."
+        prompt = f"You are an educational assistant for children. Your task is to explain a concept from a textbook before asking a question. Make the explanation engaging, interactive, and appropriate for a 7-10 year old.\n\nI'm about to ask this question: {question}\n\nProvide a very brief, engaging explanation (2-3 sentences max) that will help a child understand just the key concept needed to answer this question. Keep it simple, conversational, and interactive - like you're talking directly to the child. End your explanation with the question."
     else:
-        prompt = f"You are an educational assistant for children. Your task is to provide a short, helpful hint when a student gives an incorrect answer. Make the explanation engaging, interactive, and appropriate for a 7-10 year old.\n\nContext from textbook: {context}\n\nQuestion: {question}\nCorrect answer: {correct_answer}\nStudent's answer: {student_answer}\n\nProvide a very brief hint (1-2 sentences) to guide the student toward the correct answer. Be encouraging and interactive. End your hint by asking the question again."
+        prompt = f"You are an educational assistant for children. Your task is to provide a short, helpful hint when a student gives an incorrect answer. Make the explanation engaging, interactive, and appropriate for a 7-10 year old.\n\nQuestion: {question}\nCorrect answer: {correct_answer}\nStudent's answer: {student_answer}\n\nProvide a very brief hint (1-2 sentences) to guide the student toward the correct answer. Be encouraging and interactive. End your hint by asking the question again."
     
+    prompt = with_context(prompt, context)
+    system = get_system_prompt()
+    profile = "explain" if is_initial else "hint"
+    if stream:
+        return stream_sentences(prompt, "I'm having trouble explaining this concept. Let's try again later.",
+                                system=system, profile=profile, stop=stop)
     try:
-        return llm_response(prompt)
+        return llm_response(prompt, system=system, profile=profile)
     except Exception as e:
         print(f"Error generating explanation: {e}")
         return "I'm having trouble explaining this concept. Let's try again later."
 
-def generate_language_feedback(prompt, expected_responses, student_response=None, is_initial=True, student_profile=None):
+def generate_language_feedback(prompt, expected_responses, student_response=None, is_initial=True, student_profile=None, stream=False):
     if is_initial:
-        llm_prompt = f"You are an English language tutor for children. Present a conversational prompt in a way that's friendly and matches the child's current language level.\n\nPresent this prompt to the student: {prompt}\n\nStudent profile (if available): {student_profile if student_profile else 'New student'}"
+        llm_prompt = f"You are an English language tutor for children. Present a conversational prompt in a way that's friendly and matches the child's current language level.\n\nPresent this prompt to the student: {prompt}\n\nStudent profile (if available): {student_profile.prompt_text() if student_profile else 'New student'}"
     else:
         llm_prompt = f"""You are an English language tutor for children. Provide personalized feedback that:
 1. Adapts to their language level (simpler explanations for beginners)
@@ -216,107 +490,108 @@ Prompt given: {prompt}
 Expected responses: {expected_responses}
 Student's response: {student_response}
 
-Student profile: {student_profile if student_profile else 'New student'}
+Student profile: {student_profile.prompt_text() if student_profile else 'New student'}
 
 Provide personalized, adaptive feedback that helps them improve while maintaining their confidence."""
     
+    system = get_language_learning_prompt()
+    if stream:
+        return stream_sentences(llm_prompt, "I'm having trouble providing feedback. Let's try again.",
+                                system=system, profile="feedback")
     try:
-        return llm_response(llm_prompt)
+        return llm_response(llm_prompt, system=system, profile="feedback")
     except Exception as e:
         print(f"Error generating language feedback: {e}")
         return "I'm having trouble providing feedback. Let's try again."
 
-def tts(text):
-    stream = sd.OutputStream(
-        samplerate=voice.config.sample_rate,
-        channels=1,
-        dtype='int16',
-        blocksize=512,
-        latency='low'
-    )   
-    stream.start()
-    for audio_bytes in voice.synthesize_stream_raw(text):
-        int_data = np.frombuffer(audio_bytes, dtype=np.int16)
-        block_size = stream.blocksize
-        if block_size is not None:
-            remainder = len(int_data) % block_size
-            if remainder != 0:
-                padding = block_size - remainder
-                int_data = np.pad(int_data, (0, padding), mode='constant')
-        stream.write(int_data)
-    stream.stop()
-    stream.close()
-
-def recording():
-    p = pyaudio.PyAudio() 
-
-    print("Recording")
-
-    stream = p.open(
-        format=sample_format,
-        channels=channels,
-        rate=fs,
-        frames_per_buffer=chunk,
-        input=True,
-    )
-
-    frames = [] 
-
-    silence_threshold = 5.0
-
-    print(f"Using fixed silence threshold: {silence_threshold}")
-
-    silence_duration_limit = 2 
-    max_silence_frames = int(silence_duration_limit * fs / chunk)
-    silence_frames = 0
-    
-    max_recording_duration = 10  
-    max_recording_frames = int(max_recording_duration * fs / chunk)
-    total_frames = 0
-
-    print("Please start speaking...")
-
-    while True:
-        data = stream.read(chunk)
-        frames.append(data)
-        total_frames += 1
-
-        audio_data = np.frombuffer(data, dtype=np.int16).astype(np.float32)
-        audio_energy = np.sqrt(np.mean(audio_data**2))
-
-        if audio_energy < silence_threshold:
-            silence_frames += 1
+def tts(text, cache=False, wait=True):
+    """
+    Speaks text and, unless wait=False, waits for playback to finish. With
+    cache=True the phrase is played from the phrase cache, or rendered once and
+    stored for next time.
+    """
+    boot.first_utterance()
+    if not cache:
+        player.say(text)
+    else:
+        samples = phrase_cache.get(text)
+        if samples is not None:
+            player.play(samples)
         else:
-            silence_frames = 0 
-
-        if silence_frames > max_silence_frames:
-            print("Silence detected, stopping recording")
-            break
-            
-        if total_frames > max_recording_frames:
-            print("Maximum recording duration reached")
-            break
-
-    stream.stop_stream()
-    stream.close()
-    p.terminate()
-
-    print("Finished recording")
-
-    audio_data = b"".join(frames)
-    audio_array = np.frombuffer(audio_data, dtype=np.int16)
-    audio_array = np.reshape(audio_array, (-1, channels))
-    audio_array = audio_array.mean(axis=1) 
-    audio_array = audio_array.astype(np.float32) / 32768.0 
-
-    audio_tensor = torch.from_numpy(audio_array)
-
-    resampler = torchaudio.transforms.Resample(orig_freq=fs, new_freq=16000)
-    audio_tensor_resampled = resampler(audio_tensor)
-
-    audio_array_resampled = audio_tensor_resampled.numpy()
+            player.say(text, on_rendered=lambda rendered: phrase_cache.put(text, rendered))
+    if wait:
+        player.wait()
+
+def tts_stream(sentences):
+    """
+    Speaks sentences as they arrive from `stream_sentences`. Each sentence is
+    queued for synthesis right away, so it overlaps playback of the previous one.
+    Returns the full spoken text.
+    """
+    spoken = []
+    started = time.time()
+    for sentence in sentences:
+        if not spoken:
+            print(f"[TTS] First sentence ready after {time.time() - started:.2f}s")
+        print(f"Assistant: {sentence}")
+        spoken.append(sentence)
+        boot.first_utterance()
+        player.say(sentence)
+    player.wait()
+    return " ".join(spoken)
+
+# Render prefetched explanations with Piper too, not just generate their text.
+PREFETCH_PRESYNTHESIZE = os.getenv("PREFETCH_PRESYNTHESIZE", "1") == "1"
+
+def render_sentence(text):
+    # Shares the voice with the playback worker, so it goes through the synthesis lock.
+    return render(voice, text)
+
+def prefetch_explanation(context, question, correct_answer):
+    """Starts generating (and optionally rendering) a question's intro explanation in the background."""
+    stop = threading.Event()
+    sentences = generate_explanation(context, question, correct_answer, stream=True, stop=stop)
+    return Prefetch(sentences, render=render_sentence if PREFETCH_PRESYNTHESIZE else None,
+                    name="next explanation", on_cancel=stop.set)
+
+def tts_prefetched(prefetch):
+    """Speaks a `Prefetch`, playing pre-rendered sentences directly. Returns the spoken text."""
+    spoken = []
+    for sentence, samples in prefetch:
+        print(f"Assistant: {sentence}")
+        spoken.append(sentence)
+        boot.first_utterance()
+        if samples is not None:
+            player.play(samples)
+        else:
+            player.say(sentence)
+    player.wait()
+    return " ".join(spoken)
 
-    return audio_array_resampled
+def recording():
+    return mic.record()
+
+def transcribe(audio_array, prompt=None):
+    if len(audio_array) == 0:
+        return ""
+    return segments_text(asr.transcribe(audio_array, prompt=prompt))
+
+# Transcribe while the child is still speaking instead of after recording ends.
+STREAMING_ASR = True
+
+def listen_and_transcribe(expected=()):
+    """Records one answer and transcribes it, biased towards the `expected` answer texts."""
+    prompt = vocabulary_prompt(expected)
+    boot.wait("asr")
+    boot.wait("mic")
+    if not STREAMING_ASR:
+        return transcribe(recording(), prompt)
+    transcriber = IncrementalTranscriber(asr, convert=mic.to_asr_input, prompt=prompt).start()
+    audio_array = mic.record(on_speech=transcriber.update)
+    if len(audio_array) == 0:
+        transcriber.cancel()
+        return ""
+    return transcriber.finish(audio_array, trailing_silence=mic.trailing_silence())
 
 def educational_mode(json_data):
     print("Starting educational chatbot...")
@@ -328,93 +603,152 @@ def educational_mode(json_data):
         return
     
     current_lesson = educational_data
-    context = current_lesson["context"]
+    section_context = current_lesson["context"]
     dialogs = current_lesson["dialogs"]
     
     print(f"Loaded lesson: {current_lesson['title']}")
     
-    welcome_message = "Hi there! I'm your learning buddy. Today we're going to learn about physics. Lets start the lesson?"
+    # Sections ingested with a retrieval index get only the passages relevant to each question.
+    retriever = Retriever(current_lesson["retrieval"]) if current_lesson.get("retrieval") else None
+    
+    def context_for(dialog):
+        if retriever is None:
+            return section_context[:RETRIEVAL_MAX_CHARS]
+        context = retriever.context(f"{dialog['question']} {dialog['answer']}", RETRIEVAL_TOP_K,
+                                    fallback=section_context, max_chars=RETRIEVAL_MAX_CHARS)
+        print(f"[Retrieval] {len(context)} context chars of {sum(map(len, retriever.passages))}")
+        return context
+
+    lesson_phrases = []
+    for dialog in dialogs:
+        # Explanations precomputed at ingestion are fixed text, so they can be rendered ahead too.
+        if dialog.get("explanation"):
+            lesson_phrases.append(dialog["explanation"])
+        lesson_phrases.extend(dialog.get("hints") or [])
+        lesson_phrases.append(CORRECT_TEMPLATE.format(answer=dialog["answer"]))
+        lesson_phrases.append(PARTLY_CORRECT_TEMPLATE.format(answer=dialog["answer"]))
+    phrase_cache.prerender_in_background(voice, lesson_phrases, is_idle=lambda: not player.busy)
+    
+    # The explanation is generated while the welcome is still playing.
+    welcome_message = LECTURE_WELCOME
     print(f"Assistant: {welcome_message}")
-    tts(welcome_message)
+    tts(welcome_message, cache=True, wait=False)
     
     current_dialog_index = 0
     max_attempts = 2
+    # Explanation of the upcoming question, generated while the child answers the current one.
+    prefetched = None
     
     while current_dialog_index < len(dialogs):
         try:
             current_dialog = dialogs[current_dialog_index]
             question = current_dialog["question"]
             correct_answer = current_dialog["answer"]
+            context = context_for(current_dialog)
             
-            explanation = generate_explanation(context, question, correct_answer)
-            print(f"Assistant: {explanation}")
-            tts(explanation)
+            hints = current_dialog.get("hints") or []
+            
+            if current_dialog.get("explanation"):
+                print(f"Assistant: {current_dialog['explanation']}")
+                tts(current_dialog["explanation"], cache=True)
+            elif prefetched is not None:
+                tts_prefetched(prefetched)
+            else:
+                tts_stream(generate_explanation(context, question, correct_answer, stream=True))
+            prefetched = None
+            
+            if current_dialog_index + 1 < len(dialogs):
+                next_dialog = dialogs[current_dialog_index + 1]
+                if not next_dialog.get("explanation"):
+                    prefetched = prefetch_explanation(context_for(next_dialog), next_dialog["question"],
+                                                      next_dialog["answer"])
             
             attempts = 0
             answered_correctly = False
             
             while attempts < max_attempts and not answered_correctly:
                 print("\nWaiting for your answer...")
-                audio_array = recording()
-                student_answer = model.transcribe(audio_array, fp16=False)["text"].strip()
+                student_answer = listen_and_transcribe([correct_answer])
                 
                 temp = student_answer.lower().strip('.').split()
                 if 'stop' in temp and 'chat' in temp and 'please' in temp:
                     print("Stop word detected, ending conversation")
-                    goodbye_message = "Thanks for learning with me today! Goodbye!"
-                    tts(goodbye_message)
+                    if prefetched is not None:
+                        prefetched.cancel()
+                    goodbye_message = LECTURE_GOODBYE
+                    tts(goodbye_message, cache=True)
                     return
                 
                 if student_answer == '':
                     print("Nothing detected, please try again")
-                    tts("I didn't hear your answer. Could you please try again?")
+                    tts(LECTURE_NOT_HEARD, cache=True)
                     continue
                 
                 print(f"Student: {student_answer}")
                 
-                evaluation = evaluate_answer(student_answer, correct_answer, question)
+                # Hints are graded: later attempts get the more direct one.
+                precomputed_hint = hints[min(attempts, len(hints) - 1)] if hints else None
+                evaluation, hint, cancel_hint = evaluate_and_hint(student_answer, correct_answer, question, context,
+                                                                  hint=precomputed_hint)
                 
                 if evaluation == "correct":
+                    cancel_hint()
                     answered_correctly = True
-                    response = f"Great job! That's correct. {correct_answer}"
+                    response = CORRECT_TEMPLATE.format(answer=correct_answer)
                     print(f"Assistant: {response}")
-                    tts(response)
+                    tts(response, cache=True)
                 elif evaluation == "partially_correct" and attempts >= max_attempts - 1:
+                    cancel_hint()
                     answered_correctly = True
-                    response = f"That's partly right! The complete answer is: {correct_answer}"
+                    response = PARTLY_CORRECT_TEMPLATE.format(answer=correct_answer)
                     print(f"Assistant: {response}")
-                    tts(response)
+                    tts(response, cache=True)
                 else:
-                    feedback = generate_explanation(context, question, correct_answer, student_answer, is_initial=False)
-                    print(f"Assistant: {feedback}")
-                    tts(feedback)
+                    if isinstance(hint, str):
+                        # Precomputed hints are fixed text, in the audio bundle or the phrase cache.
+                        print(f"Assistant: {hint}")
+                        tts(hint, cache=True)
+                    else:
+                        tts_stream(hint)
                     attempts += 1
             
             current_dialog_index += 1
             
             if current_dialog_index >= len(dialogs):
-                completion_message = "Congratulations! You've completed all the questions for this lesson. You did a great job learning about physics!"
+                completion_message = LECTURE_COMPLETE
                 print(f"Assistant: {completion_message}")
-                tts(completion_message)
+                tts(completion_message, cache=True)
             else:
-                transition = "Let's move to the next question!"
+                # The prefetched explanation is queued right behind the transition.
+                transition = LECTURE_NEXT
                 print(f"Assistant: {transition}")
-                tts(transition)
-                time.sleep(1)
+                tts(transition, cache=True, wait=False)
             
+        except BootError:
+            # The ASR model or microphone never came up; retrying the turn cannot help.
+            raise
         except Exception as e:
             print(f"Error occurred: {e}")
-            error_message = "I'm having some trouble. Let's try again."
+            # The question is retried, so an explanation prefetched for the next one is stale.
+            if prefetched is not None:
+                prefetched.cancel()
+                prefetched = None
+            error_message = ERROR_MESSAGE
             print(f"Assistant: {error_message}")
-            tts(error_message)
+            tts(error_message, cache=True)
             time.sleep(1)
             continue
 
-def language_learning_mode(parent_prompt):
+def language_learning_mode(parent_prompt, server_lessons=()):
     print("Starting English language learning chatbot...")
     print("Say 'stop chat please' to exit")
     
-    language_data = load_language_learning_content(parent_prompt)
+    # The lesson is generated while the welcome is still playing.
+    welcome_message = LANGUAGE_WELCOME
+    print(f"Assistant: {welcome_message}")
+    tts(welcome_message, cache=True, wait=False)
+    
+    language_data = load_language_learning_content(parent_prompt, server_lessons)
     if not language_data:
         print("No language learning content found. Using sample data.")
     
@@ -422,17 +756,10 @@ def language_learning_mode(parent_prompt):
     conversations = current_lesson["conversations"]
     
     print(f"Loaded lesson: {current_lesson['title']} (Level: {current_lesson['level']})")
+    player.wait()
     
-    welcome_message = "Hello! I'm your English practice buddy. We'll have fun conversations together to help you learn. Let's start!"
-    print(f"Assistant: {welcome_message}")
-    tts(welcome_message)
-    
-    student_profile = {
-        "language_level": current_lesson["level"].lower(),
-        "interests": [],
-        "feedback_focus": "vocabulary",
-        "previous_responses": []
-    }
+    # Bounded and persisted across sessions, so prompts stay the same size however long the child practises.
+    student_profile = StudentProfile.load(PROFILE_PATH, language_level=current_lesson["level"].lower())
     
     current_conversation_index = 0
     max_attempts = 3
@@ -444,106 +771,115 @@ def language_learning_mode(parent_prompt):
             expected_responses = current_conversation["expected_responses"]
             follow_up = current_conversation["follow_up"]
             
-            initial_prompt = generate_language_feedback(prompt, expected_responses, student_profile=student_profile)
-            print(f"Assistant: {initial_prompt}")
-            tts(initial_prompt)
+            tts_stream(generate_language_feedback(prompt, expected_responses,
+                                                  student_profile=student_profile, stream=True))
             
             attempts = 0
             answered_correctly = False
             
             while attempts < max_attempts and not answered_correctly:
                 print("\nWaiting for your response...")
-                audio_array = recording()
-                student_response = model.transcribe(audio_array, fp16=False)["text"].strip()
+                student_response = listen_and_transcribe(expected_responses)
                 
                 temp = student_response.lower().strip('.').split()
                 if 'stop' in temp and 'chat' in temp and 'please' in temp:
                     print("Stop word detected, ending conversation")
-                    goodbye_message = "Thanks for practicing English with me today! Goodbye!"
-                    tts(goodbye_message)
+                    student_profile.save(PROFILE_PATH)
+                    goodbye_message = LANGUAGE_GOODBYE
+                    tts(goodbye_message, cache=True)
                     return
                 
                 if student_response == '':
                     print("Nothing detected, please try again")
-                    tts("I didn't hear you. Could you please try again?")
+                    tts(LANGUAGE_NOT_HEARD, cache=True)
                     continue
                 
                 print(f"Student: {student_response}")
                 
-                student_profile["previous_responses"].append(student_response)
+                student_profile.add_response(student_response)
                 
-                evaluation_result = evaluate_language_response(student_response, expected_responses, student_profile["previous_responses"])
+                evaluation_result, feedback = evaluate_and_respond(student_response, prompt, expected_responses,
+                                                                   follow_up, student_profile)
                 
-                if isinstance(evaluation_result, dict):
-                    student_profile["language_level"] = evaluation_result.get("language_level", student_profile["language_level"])
-                    if evaluation_result.get("interests"):
-                        for interest in evaluation_result["interests"]:
-                            if interest not in student_profile["interests"]:
-                                student_profile["interests"].append(interest)
-                    student_profile["feedback_focus"] = evaluation_result.get("feedback_focus", student_profile["feedback_focus"])
-                    evaluation = evaluation_result.get("evaluation", "incorrect")
-                else:
-                    evaluation = evaluation_result
+                student_profile.update(evaluation_result)
+                evaluation = evaluation_result.get("evaluation", "incorrect")
                 
-                if evaluation == "correct":
+                # The feedback is already streaming from the evaluation call.
+                tts_stream(feedback)
+                if evaluation in ("correct", "partially_correct") or attempts >= max_attempts - 1:
                     answered_correctly = True
-                    adaptive_followup = generate_language_feedback(follow_up, expected_responses, 
-                                                               student_response, is_initial=False, 
-                                                               student_profile=student_profile)
-                    print(f"Assistant: {adaptive_followup}")
-                    tts(adaptive_followup)
-                elif evaluation == "partially_correct" or attempts >= max_attempts - 1:
-                    answered_correctly = True
-                    adaptive_followup = generate_language_feedback(follow_up, expected_responses, 
-                                                              student_response, is_initial=False, 
-                                                              student_profile=student_profile)
-                    print(f"Assistant: {adaptive_followup}")
-                    tts(adaptive_followup)
                 else:
-                    feedback = generate_language_feedback(prompt, expected_responses, 
-                                                     student_response, is_initial=False, 
-                                                     student_profile=student_profile)
-                    print(f"Assistant: {feedback}")
-                    tts(feedback)
                     attempts += 1
             
             current_conversation_index += 1
             
             if current_conversation_index >= len(conversations):
-                completion_message = f"Great job today! I noticed you're interested in {', '.join(student_profile['interests'][:2]) if student_profile['interests'] else 'learning English'}. Your {student_profile['feedback_focus']} is getting better! Would you like to practice again soon?"
+                student_profile.save(PROFILE_PATH)
+                completion_message = f"Great job today! I noticed you're interested in {', '.join(student_profile.interests[-2:]) if student_profile.interests else 'learning English'}. Your {student_profile.feedback_focus} is getting better! Would you like to practice again soon?"
                 print(f"Assistant: {completion_message}")
                 tts(completion_message)
             else:
-                transition = "Let's try something new now!"
+                transition = LANGUAGE_NEXT
                 print(f"Assistant: {transition}")
-                tts(transition)
+                tts(transition, cache=True)
                 time.sleep(1)
             
+        except BootError:
+            # The ASR model or microphone never came up; retrying the turn cannot help.
+            raise
         except Exception as e:
             print(f"Error occurred: {e}")
-            error_message = "I'm having some trouble. Let's try again."
+            error_message = ERROR_MESSAGE
             print(f"Assistant: {error_message}")
-            tts(error_message)
+            tts(error_message, cache=True)
             time.sleep(1)
             continue
 
 def main():
-    try:
-        response = requests.get("https://chatbot-backend-iskc.onrender.com/api/get-json-dialogs")
-        dialogs_data = response.json()
-        print("Successfully fetched JSON data from endpoint")
-    except Exception as e:
-        print(f"Error fetching JSON data: {e}")
-        dialogs_data = {}
+    start_boot()
+    boot.wait("tts")
+    # Remaining fixed phrases are rendered/pinned once the welcome can already play.
+    boot.start("phrases", phrase_cache.warm_up, voice, FIXED_PHRASES)
+    # Start from the local copy; the sync keeps running and its result is used next time.
+    dialogs_data = lesson_store.load()
+    if dialogs_data is None:
+        # First start on this device: nothing to teach until the first sync finishes.
+        try:
+            dialogs_data = boot.wait("dialogs")
+            print("Successfully fetched JSON data from endpoint")
+        except Exception as e:
+            print(f"Error fetching JSON data: {e}")
+            dialogs_data = {}
+    else:
+        print("[Sync] Starting from the local lesson copy")
+    
+    if not dialogs_data.get('dialogs'):
+        print("No lessons available. Connect the device to the internet and try again.")
+        return
+    
+    pdf_book = dialogs_data['dialogs'][0].get('pdf_book') or {}
+    sections = (pdf_book.get('dialogs') or {}).get('sections') or []
     
     print("Welcome to the Learning Assistant!")
     print(f"Mode is {dialogs_data['dialogs'][0]['prompt']['mode']}")
-    if dialogs_data['dialogs'][0]['prompt']['mode'] == 'lecture':
-        educational_mode(dialogs_data['dialogs'][0]['pdf_book']['dialogs']['sections'][0])
-    elif dialogs_data['dialogs'][0]['prompt']['mode'] == 'chat':
-        language_learning_mode(dialogs_data['dialogs'][0]['prompt']['text'])
-    else:
-        print("Invalid mode. Please try again.")
+    try:
+        if dialogs_data['dialogs'][0]['prompt']['mode'] == 'lecture':
+            if sections and sections[0].get('audio_bundle'):
+                # Only the bundle of the section being taught; phrases are synthesized locally until it is attached.
+                boot.start("audio bundle", load_audio_bundle, sections[0]['audio_bundle'])
+            if sections:
+                educational_mode(sections[0])
+            else:
+                print("This lecture has no processed book yet.")
+        elif dialogs_data['dialogs'][0]['prompt']['mode'] == 'chat':
+            parent_prompt = dialogs_data['dialogs'][0]['prompt']['text']
+            language_learning_mode(parent_prompt, dialogs_data['dialogs'][0].get('lessons'))
+            refill_lesson_pool(parent_prompt)
+        else:
+            print("Invalid mode. Please try again.")
+    finally:
+        # Per-profile latency for tuning the caps in raspberry/llm.py.
+        llm.summary()
 
 if __name__ == "__main__":
     main() 
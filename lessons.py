@@ -0,0 +1,129 @@
+"""
+Pre-generated chat-mode lessons.
+
+When a parent saves a chat prompt, a small pool of English conversation
+lessons is generated with the server-side model for every level and stored in
+`chat_lessons`, keyed by the prompt text it was generated for. The device gets
+the pool with its dialogs, so a chat session starts with validated content
+instead of waiting for the on-device model to write a lesson. The prompt and
+validation are shared with the device (`raspberry/lesson_pool.py`).
+"""
+
+import json
+import time
+
+from sqlalchemy import text
+
+import models
+import tracing
+import usage
+from database import SessionLocal, engine
+from raspberry.lesson_pool import lesson_prompt, validate_lesson
+
+LEVELS = ["Beginner", "Elementary"]
+LESSONS_PER_LEVEL = 2
+MAX_ATTEMPTS = 3
+# API errors retried per request before the lesson run gives up.
+MAX_API_RETRIES = 3
+# Advisory lock namespace; the second key is the prompt id.
+LESSONS_LOCK_ID = 726355
+
+
+def generate_lesson(parent_prompt, level):
+    from pdf2json.book2dial import generate_response0, model_name
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        completion = generate_response0(lesson_prompt(parent_prompt, level), model_name, stage="chat_lesson",
+                                        max_retries=MAX_API_RETRIES)
+        content = completion.choices[0].message.content.strip()
+        # Models sometimes wrap the JSON in a code fence.
+        content = content[content.find("{"):content.rfind("}") + 1]
+        try:
+            lesson = validate_lesson(json.loads(content), level)
+        except ValueError as e:
+            print(f"[Lessons] Discarding unparsable {level} lesson (attempt {attempt}): {e}")
+            continue
+        if lesson is not None:
+            return lesson
+        print(f"[Lessons] Discarding {level} lesson with fewer than two usable conversations (attempt {attempt})")
+    return None
+
+
+def pregenerate_lessons(prompt_id: int):
+    """
+    Fills the lesson pool of a chat prompt. Runs as a background task with its own
+    session, since the request's session is closed by then.
+
+    Every save queues a run, so a Postgres advisory lock per prompt (shared by all
+    workers) lets only one run fill a pool at a time. A run that finds the lock
+    taken returns at once: the running one re-reads the prompt when it is done
+    and starts over if the text was edited meanwhile.
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_connection:
+        acquired = lock_connection.execute(text("SELECT pg_try_advisory_lock(:id, :prompt_id)"),
+                                           {"id": LESSONS_LOCK_ID, "prompt_id": prompt_id}).scalar()
+        if not acquired:
+            print(f"[Lessons] Lesson pool for prompt {prompt_id} is already being filled")
+            return
+        try:
+            while _pregenerate_lessons(prompt_id):
+                print(f"[Lessons] Prompt {prompt_id} was edited during generation, refilling its pool")
+        finally:
+            lock_connection.execute(text("SELECT pg_advisory_unlock(:id, :prompt_id)"),
+                                    {"id": LESSONS_LOCK_ID, "prompt_id": prompt_id})
+
+
+def _pregenerate_lessons(prompt_id):
+    """Tops up the pool once; returns True if the prompt text changed while it ran."""
+    db = SessionLocal()
+    try:
+        db_prompt = db.query(models.Prompt).filter(models.Prompt.id == prompt_id).first()
+        if not db_prompt or (db_prompt.mode or "chat") != "chat":
+            return False
+        parent_prompt = db_prompt.prompt
+        stale = db.query(models.ChatLesson).filter(
+            models.ChatLesson.prompt_id == prompt_id,
+            models.ChatLesson.prompt_text != parent_prompt
+        ).delete(synchronize_session=False)
+        if stale:
+            db.commit()
+            print(f"[Lessons] Removed {stale} lessons generated for an earlier version of prompt {prompt_id}")
+        started = time.perf_counter()
+        with tracing.start_span("pregenerate_lessons", prompt_id=prompt_id), usage.track():
+            for level in LEVELS:
+                existing = db.query(models.ChatLesson).filter(
+                    models.ChatLesson.prompt_id == prompt_id,
+                    models.ChatLesson.prompt_text == parent_prompt,
+                    models.ChatLesson.level == level
+                ).count()
+                for _ in range(LESSONS_PER_LEVEL - existing):
+                    lesson = generate_lesson(parent_prompt, level)
+                    if lesson is None:
+                        break
+                    db.add(models.ChatLesson(prompt_id=prompt_id, prompt_text=parent_prompt,
+                                             level=level, lesson=lesson))
+                    db.commit()
+        print(f"[Lessons] Lesson pool for prompt {prompt_id} ready in {time.perf_counter() - started:.1f}s")
+        db.expire_all()
+        current = db.query(models.Prompt).filter(models.Prompt.id == prompt_id).first()
+        return current is not None and current.prompt != parent_prompt
+    except Exception as e:
+        print(f"[Lessons] Error generating lessons for prompt {prompt_id}: {str(e)}")
+        tracing.record_error(e)
+        return False
+    finally:
+        db.close()
+
+
+def lessons_by_prompt(db, prompts):
+    """Maps prompt id to the stored lessons generated for that prompt's current text."""
+    texts = {prompt_id: text for prompt_id, text in prompts}
+    if not texts:
+        return {}
+    rows = db.query(models.ChatLesson).filter(models.ChatLesson.prompt_id.in_(list(texts))).all()
+    pools = {}
+    for row in rows:
+        # Lessons for an edited prompt's old text are stale.
+        if row.prompt_text == texts[row.prompt_id]:
+            pools.setdefault(row.prompt_id, []).append(row.lesson)
+    return pools
@@ -1,25 +1,27 @@
-from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form, BackgroundTasks, Header
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from sqlalchemy.orm import Session, joinedload
 from datetime import timedelta
 from typing import Optional, List, Dict, Any
 import models
 import schemas
 import auth
+import metrics
+import tracing
+import usage
+import lessons
+import sync
 from database import engine, get_db
 import os
 import json
 import tempfile
-from pdf2json.gpt import process as pdf_to_json_process
-from pdf2json.book2dial import process_json_data
 from dotenv import load_dotenv
 import time
 
 load_dotenv()
 
-models.Base.metadata.create_all(bind=engine)
-
 app = FastAPI()
 
 app.add_middleware(
@@ -29,6 +31,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine)
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
 
 @app.post("/register", response_model=schemas.User)
 def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
@@ -114,55 +122,59 @@ async def upload_pdf_book(
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    temp_dir = os.path.join(os.getcwd(), "temp_uploads")
-    os.makedirs(temp_dir, exist_ok=True)
-    
-    timestamp = int(time.time())
-    unique_filename = f"{timestamp}_{file.filename}"
-    file_path = os.path.join(temp_dir, unique_filename)
-    
-    print(f"[Upload] Received PDF upload: {file.filename}, saving as: {unique_filename}")
-    
-    file_content = await file.read()
-    with open(file_path, "wb") as f:
-        f.write(file_content)
-    
-    print(f"[Upload] PDF file saved to: {file_path}")
-    
-    db_pdf = models.PDFBook(
-        filename=file.filename,
-        book_reference=book_reference,
-        json_content={"status": "processing"},
-        user_id=current_user.id
-    )
-    
-    db.add(db_pdf)
-    db.commit()
-    db.refresh(db_pdf)
-    
-    print(f"[Upload] Created new PDF book record with ID: {db_pdf.id}")
-    
-    if prompt_id:
-        prompt = db.query(models.Prompt).filter(
-            models.Prompt.id == prompt_id,
-            models.Prompt.user_id == current_user.id
-        ).first()
-        if prompt:
-            prompt.pdf_book_id = db_pdf.id
-            db.commit()
-            print(f"[Upload] Associated PDF with prompt ID: {prompt_id}")
-    
-    background_tasks.add_task(
-        process_pdf_to_json,
-        file_path=file_path,
-        db_pdf_id=db_pdf.id,
-        user_id=current_user.id,
-        db=db
-    )
-    
-    print(f"[Upload] Started background task for processing PDF ID: {db_pdf.id}")
-    
-    return db_pdf
+    with tracing.start_span("upload_pdf_book", filename=file.filename, user_id=current_user.id) as span:
+        temp_dir = os.path.join(os.getcwd(), "temp_uploads")
+        os.makedirs(temp_dir, exist_ok=True)
+        
+        timestamp = int(time.time())
+        unique_filename = f"{timestamp}_{file.filename}"
+        file_path = os.path.join(temp_dir, unique_filename)
+        
+        print(f"[Upload] Received PDF upload: {file.filename}, saving as: {unique_filename}")
+        
+        file_content = await file.read()
+        with open(file_path, "wb") as f:
+            f.write(file_content)
+        span.set_attribute("size_bytes", len(file_content))
+        
+        print(f"[Upload] PDF file saved to: {file_path}")
+        
+        db_pdf = models.PDFBook(
+            filename=file.filename,
+            book_reference=book_reference,
+            json_content={"status": "processing"},
+            user_id=current_user.id
+        )
+        
+        db.add(db_pdf)
+        db.commit()
+        db.refresh(db_pdf)
+        span.set_attribute("pdf_id", db_pdf.id)
+        
+        print(f"[Upload] Created new PDF book record with ID: {db_pdf.id}")
+        
+        if prompt_id:
+            prompt = db.query(models.Prompt).filter(
+                models.Prompt.id == prompt_id,
+                models.Prompt.user_id == current_user.id
+            ).first()
+            if prompt:
+                prompt.pdf_book_id = db_pdf.id
+                db.commit()
+                print(f"[Upload] Associated PDF with prompt ID: {prompt_id}")
+        
+        background_tasks.add_task(
+            process_pdf_to_json,
+            file_path=file_path,
+            db_pdf_id=db_pdf.id,
+            user_id=current_user.id,
+            db=db,
+            trace_parent=span.context
+        )
+        
+        print(f"[Upload] Started background task for processing PDF ID: {db_pdf.id}")
+        
+        return db_pdf
 
 @app.get("/api/pdf-books", response_model=list[schemas.PDFBook])
 async def get_pdf_books(
@@ -173,8 +185,60 @@ async def get_pdf_books(
         models.PDFBook.user_id == current_user.id
     ).all()
 
-async def process_pdf_to_json(file_path: str, db_pdf_id: int, user_id: int, db: Session):
+def process_pdf_to_json(file_path: str, db_pdf_id: int, user_id: int, db: Session,
+                        trace_parent: Optional[tracing.SpanContext] = None):
+    # A plain function, so Starlette runs it in its threadpool (with the request's
+    # context copied) instead of blocking the event loop for the whole ingestion.
+    with tracing.start_span("process_pdf_to_json", parent=trace_parent, pdf_id=db_pdf_id, user_id=user_id), \
+            usage.track() as ledger:
+        _process_pdf_to_json(file_path, db_pdf_id, user_id, db, ledger)
+
+def _store_usage(db_pdf: models.PDFBook, ledger: usage.UsageLedger):
+    summary = ledger.summary()
+    totals = summary["totals"]
+    db_pdf.llm_usage = summary
+    db_pdf.input_tokens = totals["input_tokens"]
+    db_pdf.output_tokens = totals["output_tokens"]
+    db_pdf.cost_usd = totals["cost_usd"]
+    print(f"[PDF2JSON] LLM usage for PDF ID {db_pdf.id}: {totals['calls']} calls, "
+          f"{totals['input_tokens']} input / {totals['output_tokens']} output tokens, ${totals['cost_usd']:.4f}")
+
+def _render_audio_bundles(dialogs: Dict[str, Any]):
+    # Optional stage: only runs when the server has the devices' Piper voice configured.
+    voice_path = os.getenv("PIPER_VOICE_PATH")
+    if not voice_path:
+        return []
+    try:
+        from pdf2json.tts import render_audio_bundles
+        print(f"[PDF2JSON] Rendering lesson audio with {os.path.basename(voice_path)}")
+        return render_audio_bundles(dialogs, voice_path)
+    except Exception as e:
+        # Devices fall back to local synthesis, so a failed render never fails the ingestion.
+        print(f"[PDF2JSON] Skipping lesson audio: {str(e)}")
+        return []
+
+def _with_audio_bundles(dialogs, pdf_id: int, bundles: Dict[int, str]):
+    """Adds the `audio_bundle` of every section that has one, so devices fetch only the sections they play."""
+    if not bundles or not isinstance(dialogs, dict) or not isinstance(dialogs.get("sections"), list):
+        return dialogs
+    sections = []
+    for index, section in enumerate(dialogs["sections"]):
+        if index in bundles:
+            section = {**section, "audio_bundle": {
+                "version": bundles[index],
+                "url": f"/api/pdf-books/{pdf_id}/audio-bundle/{index}"
+            }}
+        sections.append(section)
+    return {**dialogs, "sections": sections}
+
+def _process_pdf_to_json(file_path: str, db_pdf_id: int, user_id: int, db: Session, ledger: usage.UsageLedger):
     try:
+        # The ingestion stack (PIL, pypdfium2, OpenAI client) is only needed here, so it
+        # is imported on first use instead of on every API worker boot. A failed import is
+        # reported on the book like any other ingestion error.
+        from pdf2json.gpt import process as pdf_to_json_process
+        from pdf2json.book2dial import process_json_data
+
         filename = os.path.basename(file_path)
         folder = os.path.dirname(file_path)
         
@@ -185,16 +249,20 @@ async def process_pdf_to_json(file_path: str, db_pdf_id: int, user_id: int, db:
             raise Exception("OpenAI API key not found in environment variables")
         
         print(f"[PDF2JSON] Converting PDF to structured JSON")
-        combined_json = pdf_to_json_process(
-            filename=filename,
-            folder=folder,
-            api_key=api_key,
-            verbose=True,
-            cleanup=True
-        )
+        with metrics.time_stage("pdf_to_json"):
+            combined_json = pdf_to_json_process(
+                filename=filename,
+                folder=folder,
+                api_key=api_key,
+                verbose=True,
+                cleanup=True
+            )
         
         print(f"[PDF2JSON] Generating dialogs from structured JSON")
-        dialogs = process_json_data(combined_json)
+        with metrics.time_stage("dialog_generation"):
+            dialogs = process_json_data(combined_json)
+        
+        audio_bundles = _render_audio_bundles(dialogs)
         
         print(f"[PDF2JSON] Dialog generation complete, saving to database")
         db_pdf = db.query(models.PDFBook).filter(
@@ -203,8 +271,14 @@ async def process_pdf_to_json(file_path: str, db_pdf_id: int, user_id: int, db:
         ).first()
         
         if db_pdf:
-            db_pdf.json_content = dialogs
-            db.commit()
+            with tracing.start_span("db.commit", pdf_id=db_pdf_id):
+                db_pdf.json_content = dialogs
+                db_pdf.audio_bundles = [
+                    models.SectionAudioBundle(section_index=index, version=version, bundle=bundle)
+                    for index, bundle, version in audio_bundles
+                ]
+                _store_usage(db_pdf, ledger)
+                db.commit()
             print(f"[PDF2JSON] Successfully updated database with dialogs for PDF ID {db_pdf_id}")
             
             try:
@@ -216,6 +290,7 @@ async def process_pdf_to_json(file_path: str, db_pdf_id: int, user_id: int, db:
             
     except Exception as e:
         print(f"[PDF2JSON] Error processing PDF: {str(e)}")
+        tracing.record_error(e)
         db_pdf = db.query(models.PDFBook).filter(
             models.PDFBook.id == db_pdf_id,
             models.PDFBook.user_id == user_id
@@ -223,6 +298,7 @@ async def process_pdf_to_json(file_path: str, db_pdf_id: int, user_id: int, db:
         
         if db_pdf:
             db_pdf.json_content = {"status": "error", "message": str(e)}
+            _store_usage(db_pdf, ledger)
             db.commit()
             print(f"[PDF2JSON] Updated database with error status for PDF ID {db_pdf_id}")
         
@@ -255,6 +331,48 @@ async def get_pdf_book_status(
     
     return {"status": "complete"}
 
+@app.get("/api/pdf-books/{pdf_id}/audio-bundle/{section_index}")
+def get_pdf_book_audio_bundle(pdf_id: int, section_index: int, if_none_match: Optional[str] = Header(None),
+                              db: Session = Depends(get_db)):
+    section_filter = (models.SectionAudioBundle.pdf_book_id == pdf_id,
+                      models.SectionAudioBundle.section_index == section_index)
+    version = db.query(models.SectionAudioBundle.version).filter(*section_filter).scalar()
+    if not version:
+        raise HTTPException(status_code=404, detail="No audio bundle for this section")
+    etag = f'"{version}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    bundle = db.query(models.SectionAudioBundle.bundle).filter(*section_filter).scalar()
+    return Response(content=bundle, media_type="application/octet-stream",
+                    headers={"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"})
+
+@app.get("/api/pdf-books/{pdf_id}/usage", response_model=schemas.PDFBookUsage)
+async def get_pdf_book_usage(
+    pdf_id: int,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    db_pdf = db.query(models.PDFBook).filter(
+        models.PDFBook.id == pdf_id,
+        models.PDFBook.user_id == current_user.id
+    ).first()
+
+    if not db_pdf:
+        raise HTTPException(status_code=404, detail="PDF book not found")
+
+    return {"pdf_id": db_pdf.id, **usage.merge_summaries([db_pdf.llm_usage])}
+
+@app.get("/api/usage", response_model=schemas.UserUsage)
+async def get_user_usage(
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    summaries = [row.llm_usage for row in db.query(models.PDFBook.llm_usage).filter(
+        models.PDFBook.user_id == current_user.id,
+        models.PDFBook.llm_usage.isnot(None)
+    ).all()]
+    return {"user_id": current_user.id, "books": len(summaries), **usage.merge_summaries(summaries)}
+
 @app.delete("/api/pdf-books/{pdf_id}")
 async def delete_pdf_book(
     pdf_id: int,
@@ -281,6 +399,7 @@ async def delete_pdf_book(
 @app.post("/api/prompts", response_model=schemas.Prompt)
 async def create_prompt(
     prompt: schemas.PromptCreate,
+    background_tasks: BackgroundTasks,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -294,12 +413,15 @@ async def create_prompt(
     db.add(db_prompt)
     db.commit()
     db.refresh(db_prompt)
+    if (db_prompt.mode or "chat") == "chat":
+        background_tasks.add_task(lessons.pregenerate_lessons, db_prompt.id)
     return db_prompt
 
 @app.put("/api/prompts/{prompt_id}", response_model=schemas.Prompt)
 async def update_prompt(
     prompt_id: int,
     prompt_update: schemas.PromptUpdate,
+    background_tasks: BackgroundTasks,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -314,6 +436,8 @@ async def update_prompt(
         db_prompt.mode = prompt_update.mode
     db.commit()
     db.refresh(db_prompt)
+    if (db_prompt.mode or "chat") == "chat":
+        background_tasks.add_task(lessons.pregenerate_lessons, db_prompt.id)
     return db_prompt
 
 @app.delete("/api/prompts/{prompt_id}")
@@ -369,7 +493,12 @@ async def read_notes(
     return query.offset(skip).limit(limit).all()
 
 @app.get("/api/get-json-dialogs")
-async def get_json_dialogs(db: Session = Depends(get_db)):
+async def get_json_dialogs(
+    response: Response,
+    have: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
     result = db.query(
         models.Prompt.id.label("prompt_id"),
         models.Prompt.name.label("prompt_name"),
@@ -384,6 +513,19 @@ async def get_json_dialogs(db: Session = Depends(get_db)):
         isouter=True
     ).all()
     
+    lesson_pools = lessons.lessons_by_prompt(
+        db, [(row.prompt_id, row.prompt_text) for row in result if (row.prompt_mode or "chat") == "chat"])
+    
+    audio_bundles = {}
+    pdf_ids = {row.pdf_id for row in result if row.pdf_id is not None}
+    if pdf_ids:
+        for bundle in db.query(
+            models.SectionAudioBundle.pdf_book_id,
+            models.SectionAudioBundle.section_index,
+            models.SectionAudioBundle.version
+        ).filter(models.SectionAudioBundle.pdf_book_id.in_(list(pdf_ids))).all():
+            audio_bundles.setdefault(bundle.pdf_book_id, {})[bundle.section_index] = bundle.version
+    
     formatted_data = []
     for row in result:
         item = {
@@ -393,16 +535,24 @@ async def get_json_dialogs(db: Session = Depends(get_db)):
                 "text": row.prompt_text,
                 "mode": row.prompt_mode or "chat"
             },
-            "pdf_book": None
+            "pdf_book": None,
+            "lessons": lesson_pools.get(row.prompt_id, [])
         }
         
         if row.pdf_id is not None:
             item["pdf_book"] = {
                 "id": row.pdf_id,
                 "book_reference": row.book_reference,
-                "dialogs": row.json_content
+                # The bundle is part of its section, so a re-rendered bundle changes the section version.
+                "dialogs": sync.stamp_sections(
+                    _with_audio_bundles(row.json_content, row.pdf_id, audio_bundles.get(row.pdf_id)))
             }
         
         formatted_data.append(item)
     
-    return {"dialogs": formatted_data} 
\ No newline at end of file
+    # Devices keep a local copy (raspberry/lesson_store.py) and only download what changed.
+    etag = f'"{sync.content_version(formatted_data)}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return {"dialogs": sync.strip_known_sections(formatted_data, sync.parse_have(have))}
@@ -0,0 +1,266 @@
+"""
+metrics.py
+
+In-process metrics registry exposed in the Prometheus text format.
+
+Request metrics are recorded by `MetricsMiddleware`, database query counts by
+`instrument_engine`, and pipeline stage timings (pdf2json, book2dial) through
+`time_stage`. Everything lives in one registry per process and is rendered by
+the `/metrics` endpoint.
+"""
+
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+STAGE_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram:
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, (list(s[0]), s[1], s[2])) for labels, s in self._values.items()]
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', le))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+http_requests_total = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+http_request_duration_seconds = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+http_requests_in_flight = REGISTRY.gauge(
+    "http_requests_in_flight", "HTTP requests currently being served.")
+http_request_size_bytes = REGISTRY.histogram(
+    "http_request_size_bytes", "HTTP request body size.", ("method", "route"), SIZE_BUCKETS)
+http_response_size_bytes = REGISTRY.histogram(
+    "http_response_size_bytes", "HTTP response body size.", ("method", "route"), SIZE_BUCKETS)
+db_queries_per_request = REGISTRY.histogram(
+    "http_request_db_queries", "Database queries issued per HTTP request.", ("method", "route"), COUNT_BUCKETS)
+db_seconds_per_request = REGISTRY.histogram(
+    "http_request_db_seconds", "Time spent in database queries per HTTP request.", ("method", "route"))
+pipeline_stage_seconds = REGISTRY.histogram(
+    "pipeline_stage_duration_seconds", "Duration of PDF ingestion and dialog generation stages.",
+    ("stage",), STAGE_BUCKETS)
+pipeline_stage_errors_total = REGISTRY.counter(
+    "pipeline_stage_errors_total", "Failed PDF ingestion and dialog generation stages.", ("stage",))
+
+# [query count, seconds] for the request being served in the current context.
+_db_usage = ContextVar("db_usage", default=None)
+
+
+@contextmanager
+def time_stage(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        pipeline_stage_errors_total.inc(stage)
+        raise
+    finally:
+        pipeline_stage_seconds.observe(time.perf_counter() - started, stage)
+
+
+def instrument_engine(engine):
+    """Counts queries and their duration against the request currently being served."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        usage = _db_usage.get()
+        if usage is not None:
+            usage[0] += 1
+            usage[1] += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware (no BaseHTTPMiddleware) so the per-request overhead is
+    a few dictionary updates. Routes are labelled by their path template, e.g.
+    `/api/pdf-books/{pdf_id}/status`, to keep label cardinality bounded.
+    """
+
+    def __init__(self, app, skip_paths=("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        response_size = 0
+        request_size = 0
+        for name, value in scope.get("headers", ()):
+            if name == b"content-length":
+                request_size = int(value or 0)
+                break
+
+        usage = [0, 0.0]
+        finished = None
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_size, finished
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    # Background tasks run after this inside the same call; they
+                    # must not count towards the request's latency or queries.
+                    finished = (time.perf_counter(), usage[0], usage[1])
+            await send(message)
+
+        token = _db_usage.set(usage)
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if finished is None:
+                finished = (time.perf_counter(), usage[0], usage[1])
+            http_requests_in_flight.dec()
+            _db_usage.reset(token)
+            route = _route_template(scope)
+            http_requests_total.inc(method, route, str(status_code))
+            http_request_duration_seconds.observe(finished[0] - started, method, route)
+            http_request_size_bytes.observe(request_size, method, route)
+            http_response_size_bytes.observe(response_size, method, route)
+            db_queries_per_request.observe(finished[1], method, route)
+            db_seconds_per_request.observe(finished[2], method, route)
+
+
+_route_paths = {}
+
+
+def _route_template(scope):
+    route = scope.get("route")
+    if route is not None and hasattr(route, "path"):
+        return route.path
+    endpoint = scope.get("endpoint")
+    app = scope.get("app")
+    if endpoint is None or app is None:
+        return "unmatched"
+    path = _route_paths.get(endpoint)
+    if path is None:
+        for candidate in getattr(app, "routes", ()):
+            if getattr(candidate, "endpoint", None) is endpoint:
+                path = _route_paths[endpoint] = candidate.path
+                break
+    return path or "unmatched"
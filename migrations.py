@@ -1,44 +1,353 @@
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
-from models import Base, User, Prompt, History
-from database import SQLALCHEMY_DATABASE_URL
-
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-def init_db():
-    Base.metadata.create_all(bind=engine)
-
-def migrate():
-    with engine.connect() as connection:
-        connection.execute(text("""
-            ALTER TABLE users 
-            ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-            ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE;
-        """))
-        
-        connection.execute(text("""
-            ALTER TABLE prompts 
-            ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-            ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE,
-            ADD COLUMN IF NOT EXISTS pdf_book_id INTEGER REFERENCES pdf_books(id),
-            ADD COLUMN IF NOT EXISTS mode VARCHAR(20) DEFAULT 'chat';
-        """))
-        
-        connection.execute(text("""
-            ALTER TABLE history 
-            ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP;
-        """))
-        
-        connection.execute(text("""
-            ALTER TABLE pdf_books 
-            DROP COLUMN IF EXISTS file_content,
-            ADD COLUMN IF NOT EXISTS json_content JSONB;
-        """))
-        
-        connection.commit()
+import sys
+import time
+from sqlalchemy import text
+from database import engine
+
+# Every DDL statement gives up quickly instead of queueing behind long
+# transactions, so a deploy can never stall live traffic on a table lock.
+LOCK_TIMEOUT = "5s"
+BACKFILL_BATCH_SIZE = 1000
+MIGRATION_LOCK_ID = 726354
+
+
+class Migration:
+    def __init__(self, version, name, upgrade, transactional=True):
+        self.version = version
+        self.name = name
+        self.upgrade = upgrade
+        self.transactional = transactional
+
+
+def create_index_concurrently(connection, name, table, columns, unique=False):
+    """
+    Builds an index without taking a write lock on the table.
+
+    Must be run on an AUTOCOMMIT connection. A previous failed concurrent build
+    leaves an INVALID index behind, which is dropped and rebuilt.
+    """
+    invalid = connection.execute(text("""
+        SELECT 1 FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = :name AND NOT i.indisvalid
+    """), {"name": name}).first()
+    if invalid:
+        print(f"[Migrations] Dropping invalid index {name} left by an interrupted build")
+        connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+    unique_sql = "UNIQUE " if unique else ""
+    connection.execute(text(
+        f"CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+    ))
+
+
+def backfill(connection, table, set_clause, where_clause, params=None,
+             batch_size=BACKFILL_BATCH_SIZE, pause=0.05):
+    """
+    Updates rows matching `where_clause` in small batches.
+
+    Must be run on an AUTOCOMMIT connection so every batch commits on its own and
+    row locks are only held for one batch. `where_clause` has to stop matching a
+    row once it has been updated, otherwise the loop never ends.
+
+    Returns:
+        int: Total number of rows updated.
+    """
+    total = 0
+    while True:
+        result = connection.execute(text(f"""
+            UPDATE {table} SET {set_clause}
+            WHERE id IN (
+                SELECT id FROM {table}
+                WHERE {where_clause}
+                ORDER BY id
+                LIMIT :batch_size
+                FOR UPDATE SKIP LOCKED
+            )
+        """), {"batch_size": batch_size, **(params or {})})
+        if result.rowcount == 0:
+            break
+        total += result.rowcount
+        print(f"[Migrations] Backfilled {total} rows in {table}")
+        time.sleep(pause)
+    return total
+
+
+def _initial_schema(connection):
+    # The baseline schema as explicit DDL: this step must not change when models.py does,
+    # later columns and tables belong to their own migrations.
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            email VARCHAR,
+            hashed_password VARCHAR,
+            name VARCHAR,
+            phone VARCHAR,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            updated_at TIMESTAMP WITH TIME ZONE
+        )
+    """))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_users_id ON users (id)"))
+    connection.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email ON users (email)"))
+
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS notes (
+            id SERIAL PRIMARY KEY,
+            content TEXT,
+            feedback TEXT,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            child_name VARCHAR,
+            parent_id INTEGER REFERENCES users(id)
+        )
+    """))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_notes_id ON notes (id)"))
+
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS pdf_books (
+            id SERIAL PRIMARY KEY,
+            filename VARCHAR,
+            book_reference VARCHAR,
+            json_content JSON,
+            user_id INTEGER REFERENCES users(id),
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            updated_at TIMESTAMP WITH TIME ZONE
+        )
+    """))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_pdf_books_id ON pdf_books (id)"))
+
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS prompts (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR,
+            prompt TEXT,
+            user_id INTEGER REFERENCES users(id),
+            pdf_book_id INTEGER REFERENCES pdf_books(id),
+            mode VARCHAR DEFAULT 'chat',
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            updated_at TIMESTAMP WITH TIME ZONE
+        )
+    """))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_prompts_id ON prompts (id)"))
+
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS history (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id),
+            prompt_id INTEGER REFERENCES prompts(id),
+            conversation TEXT,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+        )
+    """))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_history_id ON history (id)"))
+
+
+def _legacy_columns(connection):
+    connection.execute(text("""
+        ALTER TABLE users
+        ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE;
+    """))
+
+    connection.execute(text("""
+        ALTER TABLE prompts
+        ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE,
+        ADD COLUMN IF NOT EXISTS pdf_book_id INTEGER REFERENCES pdf_books(id),
+        ADD COLUMN IF NOT EXISTS mode VARCHAR(20) DEFAULT 'chat';
+    """))
+
+    connection.execute(text("""
+        ALTER TABLE history
+        ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP;
+    """))
+
+    connection.execute(text("""
+        ALTER TABLE pdf_books
+        DROP COLUMN IF EXISTS file_content,
+        ADD COLUMN IF NOT EXISTS json_content JSONB;
+    """))
+
+
+def _foreign_key_indexes(connection):
+    create_index_concurrently(connection, "ix_prompts_user_id", "prompts", ["user_id"])
+    create_index_concurrently(connection, "ix_prompts_pdf_book_id", "prompts", ["pdf_book_id"])
+    create_index_concurrently(connection, "ix_pdf_books_user_id", "pdf_books", ["user_id"])
+    create_index_concurrently(connection, "ix_history_user_id", "history", ["user_id"])
+    create_index_concurrently(connection, "ix_notes_parent_id", "notes", ["parent_id"])
+
+
+def _backfill_prompt_mode(connection):
+    backfill(connection, "prompts", "mode = 'chat'", "mode IS NULL")
+
+
+def _pdf_book_usage_columns(connection):
+    connection.execute(text("""
+        ALTER TABLE pdf_books
+        ADD COLUMN IF NOT EXISTS llm_usage JSONB,
+        ADD COLUMN IF NOT EXISTS input_tokens INTEGER,
+        ADD COLUMN IF NOT EXISTS output_tokens INTEGER,
+        ADD COLUMN IF NOT EXISTS cost_usd DOUBLE PRECISION;
+    """))
+
+
+def _chat_lessons_table(connection):
+    # A new, empty table, so creating it (and its prompt_id index) takes no long locks.
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS chat_lessons (
+            id SERIAL PRIMARY KEY,
+            prompt_id INTEGER REFERENCES prompts(id) ON DELETE CASCADE,
+            prompt_text TEXT,
+            level VARCHAR,
+            lesson JSON,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+        )
+    """))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_chat_lessons_id ON chat_lessons (id)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_chat_lessons_prompt_id ON chat_lessons (prompt_id)"))
+
+
+def _pdf_book_audio_bundle(connection):
+    connection.execute(text("""
+        ALTER TABLE pdf_books
+        ADD COLUMN IF NOT EXISTS audio_bundle BYTEA,
+        ADD COLUMN IF NOT EXISTS audio_bundle_version VARCHAR;
+    """))
+
+
+def _section_audio_bundles(connection):
+    # One bundle per section instead of one per book. Book-wide bundles are dropped;
+    # devices synthesize those phrases locally until the book is ingested again.
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS section_audio_bundles (
+            id SERIAL PRIMARY KEY,
+            pdf_book_id INTEGER REFERENCES pdf_books(id) ON DELETE CASCADE,
+            section_index INTEGER,
+            version VARCHAR,
+            bundle BYTEA
+        )
+    """))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_section_audio_bundles_id ON section_audio_bundles (id)"))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_section_audio_bundles_pdf_book_id ON section_audio_bundles (pdf_book_id)"))
+    connection.execute(text("""
+        ALTER TABLE pdf_books
+        DROP COLUMN IF EXISTS audio_bundle,
+        DROP COLUMN IF EXISTS audio_bundle_version;
+    """))
+
+
+MIGRATIONS = [
+    Migration(1, "initial_schema", _initial_schema),
+    Migration(2, "legacy_columns", _legacy_columns),
+    Migration(3, "foreign_key_indexes", _foreign_key_indexes, transactional=False),
+    Migration(4, "backfill_prompt_mode", _backfill_prompt_mode, transactional=False),
+    Migration(5, "pdf_book_usage_columns", _pdf_book_usage_columns),
+    Migration(6, "chat_lessons_table", _chat_lessons_table),
+    Migration(7, "pdf_book_audio_bundle", _pdf_book_audio_bundle),
+    Migration(8, "section_audio_bundles", _section_audio_bundles),
+]
+
+
+def ensure_version_table(connection):
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR NOT NULL,
+            applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            duration_ms INTEGER
+        )
+    """))
+
+
+def applied_versions(connection):
+    rows = connection.execute(text("SELECT version FROM schema_migrations"))
+    return {row.version for row in rows}
+
+
+def current_version():
+    with engine.begin() as connection:
+        ensure_version_table(connection)
+        row = connection.execute(text("SELECT MAX(version) AS version FROM schema_migrations")).first()
+        return row.version or 0
+
+
+def _record(connection, migration, duration_ms):
+    connection.execute(text("""
+        INSERT INTO schema_migrations (version, name, duration_ms)
+        VALUES (:version, :name, :duration_ms)
+    """), {"version": migration.version, "name": migration.name, "duration_ms": duration_ms})
+
+
+def _apply(migration):
+    started = time.perf_counter()
+    if migration.transactional:
+        with engine.begin() as connection:
+            connection.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+            migration.upgrade(connection)
+            duration_ms = int((time.perf_counter() - started) * 1000)
+            _record(connection, migration, duration_ms)
+    else:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text(f"SET lock_timeout = '{LOCK_TIMEOUT}'"))
+            migration.upgrade(connection)
+        duration_ms = int((time.perf_counter() - started) * 1000)
+        with engine.begin() as connection:
+            _record(connection, migration, duration_ms)
+    return duration_ms
+
+
+def migrate(target=None):
+    """
+    Applies every pending migration up to `target` (default: latest), in order.
+
+    A Postgres advisory lock makes concurrent deploys wait for each other instead
+    of applying the same step twice.
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_connection:
+        lock_connection.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        try:
+            with engine.begin() as connection:
+                ensure_version_table(connection)
+                done = applied_versions(connection)
+
+            pending = [m for m in MIGRATIONS
+                       if m.version not in done and (target is None or m.version <= target)]
+            if not pending:
+                print(f"[Migrations] Schema is up to date (version {max(done) if done else 0})")
+                return
+
+            for migration in sorted(pending, key=lambda m: m.version):
+                print(f"[Migrations] Applying {migration.version}_{migration.name}")
+                duration_ms = _apply(migration)
+                print(f"[Migrations] Applied {migration.version}_{migration.name} in {duration_ms} ms")
+        finally:
+            lock_connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+
+
+def status():
+    with engine.begin() as connection:
+        ensure_version_table(connection)
+        rows = connection.execute(text(
+            "SELECT version, name, applied_at, duration_ms FROM schema_migrations ORDER BY version"
+        )).all()
+    applied = {row.version: row for row in rows}
+    for migration in MIGRATIONS:
+        row = applied.get(migration.version)
+        if row:
+            print(f"{migration.version:>4}  {migration.name:<28} applied {row.applied_at} ({row.duration_ms} ms)")
+        else:
+            print(f"{migration.version:>4}  {migration.name:<28} pending")
+
 
 if __name__ == "__main__":
-    init_db()
-    migrate()
-    print("Database tables created and migration completed successfully!") 
\ No newline at end of file
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    if command == "upgrade":
+        target = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        migrate(target)
+        print("Database migration completed successfully!")
+    elif command == "status":
+        status()
+    elif command == "version":
+        print(current_version())
+    else:
+        print(f"Unknown command '{command}'. Use: upgrade [version] | status | version")
+        sys.exit(1)
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, JSON, Float, LargeBinary
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
 from datetime import datetime
 from database import Base
@@ -28,7 +28,7 @@ class Note(Base):
     feedback = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     child_name = Column(String)
-    parent_id = Column(Integer, ForeignKey("users.id"))
+    parent_id = Column(Integer, ForeignKey("users.id"), index=True)
     parent = relationship("User", back_populates="notes")
 
 class Prompt(Base):
@@ -37,14 +37,15 @@ class Prompt(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
     prompt = Column(Text)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    pdf_book_id = Column(Integer, ForeignKey("pdf_books.id"), nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    pdf_book_id = Column(Integer, ForeignKey("pdf_books.id"), nullable=True, index=True)
     mode = Column(String, default="chat")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     user = relationship("User", back_populates="prompts")
     pdf_book = relationship("PDFBook", back_populates="prompts")
+    lessons = relationship("ChatLesson", back_populates="prompt", cascade="all, delete-orphan")
 
 class PDFBook(Base):
     __tablename__ = "pdf_books"
@@ -53,20 +54,52 @@ class PDFBook(Base):
     filename = Column(String)
     book_reference = Column(String)
     json_content = Column(JSON)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    llm_usage = Column(JSON, nullable=True)
+    input_tokens = Column(Integer, nullable=True)
+    output_tokens = Column(Integer, nullable=True)
+    cost_usd = Column(Float, nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     user = relationship("User", back_populates="pdf_books")
     prompts = relationship("Prompt", back_populates="pdf_book")
+    audio_bundles = relationship("SectionAudioBundle", back_populates="pdf_book", cascade="all, delete-orphan")
 
 class History(Base):
     __tablename__ = "history"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     prompt_id = Column(Integer, ForeignKey("prompts.id"))
     conversation = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
-    user = relationship("User", back_populates="history") 
\ No newline at end of file
+    user = relationship("User", back_populates="history") 
+
+class ChatLesson(Base):
+    __tablename__ = "chat_lessons"
+
+    id = Column(Integer, primary_key=True, index=True)
+    prompt_id = Column(Integer, ForeignKey("prompts.id", ondelete="CASCADE"), index=True)
+    # The prompt text the lesson was generated for; lessons of an edited prompt are stale.
+    prompt_text = Column(Text)
+    level = Column(String)
+    lesson = Column(JSON)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    prompt = relationship("Prompt", back_populates="lessons")
+
+class SectionAudioBundle(Base):
+    __tablename__ = "section_audio_bundles"
+
+    id = Column(Integer, primary_key=True, index=True)
+    pdf_book_id = Column(Integer, ForeignKey("pdf_books.id", ondelete="CASCADE"), index=True)
+    # Position of the section in the book's dialogs; devices fetch only the sections they play.
+    section_index = Column(Integer)
+    version = Column(String)
+    # gzip-compressed pre-rendered lesson audio, see raspberry/audio_bundle.py; deferred
+    # so listing bundles does not load megabytes of audio.
+    bundle = deferred(Column(LargeBinary))
+
+    pdf_book = relationship("PDFBook", back_populates="audio_bundles")
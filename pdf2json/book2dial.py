@@ -3,12 +3,27 @@ import json
 import time
 from openai import OpenAI
 from dotenv import load_dotenv
+from metrics import time_stage
+from tracing import start_span, record_usage
+from usage import record_call, BudgetExceeded
+from raspberry.retrieval import build_index, Retriever
 
 load_dotenv('.env')
 
-client = OpenAI(
-    api_key=os.environ.get('OPENAI_API_KEY'),
-)
+# Passages retrieved per question, for generation here and for the device prompts.
+RETRIEVAL_TOP_K = 3
+
+_client = None
+
+
+def get_client():
+    # Built on first use so importing this module stays cheap for API workers.
+    global _client
+    if _client is None:
+        _client = OpenAI(
+            api_key=os.environ.get('OPENAI_API_KEY'),
+        )
+    return _client
 
 
 def generate_prompt1(chapter_title, section_title, chapter_summary, bold_terms, learning_objectives, concepts, introduction, previous_conversation):
@@ -50,24 +65,52 @@ def generate_prompt2(chapter_title, section_title,context, chapter_summary, bold
     return prompt
 
 
-def generate_response0(prompt, model):
+def generate_prompt3(question, answer, context):
+    prompt = ("Task: You are a friendly teacher preparing to ask a 7-10 year old child a question about a textbook "
+    "subsection. Write a short spoken explanation to give before the question and two hints for a child who "
+    "answers wrongly.\n\n"
+    f"Information Provided:\n"
+    f"1. **Subsection Content:** {context}\n"
+    f"2. **Question:** {question}\n"
+    f"3. **Correct Answer:** {answer}\n\n"
+    "*Note:* The explanation is 2-3 simple, engaging sentences about just the key concept needed to answer, and "
+    "ends by asking the question. The first hint gently points the child in the right direction without giving "
+    "the answer away; the second hint is more direct. Each hint is 1-2 sentences and ends by asking the question "
+    "again. Talk directly to the child.\n\n"
+    'Expected Output: A JSON object: {"explanation": "...", "hints": ["first hint", "second hint"]}')
+
+    return prompt
+
+
+def generate_response0(prompt, model, stage="dialog", max_retries=None):
+    """Retries failed API calls every 2 seconds; after `max_retries` retries (None: forever) the error is raised."""
+    retries = 0
     while True:
         try:
             print(f"[Book2Dial] Sending request to OpenAI API with model: {model}")
-            completion = client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}]
-             )
+            with time_stage("dialog_llm_call"), start_span("llm.dialog", stage=stage) as span:
+                started = time.perf_counter()
+                completion = get_client().chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}]
+                )
+                record_usage(span, completion.usage, model)
             print(f"[Book2Dial] Successfully received response from OpenAI API")
-            return completion
         except Exception as e:
+            if max_retries is not None and retries >= max_retries:
+                print(f"[Book2Dial] Error occurred while generating response: {str(e)}. Giving up after {retries} retries")
+                raise
+            retries += 1
             print(f"[Book2Dial] Error occurred while generating response: {str(e)}. Retrying in 2 seconds...")
             time.sleep(2)
+            continue
+        record_call(stage, model, completion.usage, time.perf_counter() - started, retries=retries)
+        return completion
 
 
 def generate_question(chapter_title, section_title, chapter_summary, bold_terms, learning_objectives, concepts, introduction, previous_conversation, model):
     prompt = generate_prompt1(chapter_title, section_title, chapter_summary, bold_terms, learning_objectives, concepts, introduction, previous_conversation)
-    completion = generate_response0(prompt, model)
+    completion = generate_response0(prompt, model, stage="dialog_question")
     question = completion.choices[0].message.content
     # escaped_content = question.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\t', '\\t')
     return question
@@ -77,12 +120,36 @@ def generate_answer(question, context, chapter_title, section_title, chapter_sum
         print('[Book2Dial] Empty question was given as input.')
         return None
     prompt = generate_prompt2(chapter_title, section_title, context, chapter_summary, bold_terms, learning_objectives, concepts, introduction, previous_conversation,question)
-    completion = generate_response0(prompt, model)
+    completion = generate_response0(prompt, model, stage="dialog_answer")
     answer = completion.choices[0].message.content
     # escaped_content = answer_data.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\t', '\\t')
     return answer
 
 
+def generate_tutoring(question, answer, context, model):
+    """
+    Precomputes the child-level intro explanation and graded hints for a dialog
+    turn, so the device can speak them instead of generating them live.
+
+    Returns:
+        dict: {"explanation": str, "hints": [str, ...]}, or an empty dict when the
+        model's output could not be parsed.
+    """
+    prompt = generate_prompt3(question, answer, context)
+    completion = generate_response0(prompt, model, stage="dialog_tutoring")
+    content = completion.choices[0].message.content or ""
+    try:
+        data = json.loads(content[content.find("{"):content.rfind("}") + 1])
+    except ValueError:
+        print(f"[Book2Dial] Could not parse explanation and hints: {content[:50]}...")
+        return {}
+    explanation = str(data.get("explanation") or "").strip()
+    hints = [str(hint).strip() for hint in data.get("hints") or [] if str(hint).strip()]
+    if not explanation:
+        return {}
+    return {"explanation": explanation, "hints": hints}
+
+
 model_name = "gpt-4o-mini"
 
 def make_json_friendly(s):
@@ -90,11 +157,32 @@ def make_json_friendly(s):
     s = s.replace('"', '\\"')
     return s
 
-def generate_dialog_for_section(section, model_name, turns=12):
+def section_passages(section):
+    """
+    Collects the retrievable text of a section.
+
+    Args:
+        section (dict): One entry of the `data` list produced by `gpt.process`.
+
+    Returns:
+        list: Every paragraph, then one passage per vocabulary word.
+    """
+    passages = [paragraph.get("context", "") for paragraph in section.get("paragraphs", [])]
+    for item in section.get("vocabulary", []):
+        if isinstance(item, dict) and item.get("word"):
+            passage = f"{item['word']}: {item.get('child_friendly_definition', '')}"
+            if item.get("example_sentence"):
+                passage += f" For example: {item['example_sentence']}"
+            passages.append(passage)
+    return passages
+
+
+def generate_dialog_for_section(section, model_name, turns=12, index=None):
     print(f"[Book2Dial] Generating dialog for section: {section.get('title', 'Unknown section')}")
     chapter_title = section.get("title", "")
     paragraphs = section.get("paragraphs", [])
-    context = paragraphs[0]["context"] if paragraphs else ""
+    first_paragraph = paragraphs[0]["context"] if paragraphs else ""
+    retriever = Retriever(index or build_index(section_passages(section)))
     
     bold_terms = ', '.join(term.strip() for term in section.get('bold_terms', []))
     
@@ -117,13 +205,18 @@ def generate_dialog_for_section(section, model_name, turns=12):
         question = generate_question(chapter_title, section_title, chapter_summary, bold_terms, learning_objectives, concepts, introduction, previous_conversation, model_name)
         print(f"[Book2Dial] Generated question: {question[:50]}...")
         
+        # Ground each turn in the passages relevant to it rather than only the first paragraph.
+        context = retriever.context(question, RETRIEVAL_TOP_K, fallback=first_paragraph)
         answer = generate_answer(question, context, chapter_title, section_title, chapter_summary, bold_terms, learning_objectives, concepts, introduction, previous_conversation, model_name)
         print(f"[Book2Dial] Generated answer: {answer[:50]}...")
 
+        tutoring = generate_tutoring(question, answer, retriever.context(f"{question} {answer}", RETRIEVAL_TOP_K,
+                                                                         fallback=first_paragraph), model_name)
         
         dialogs.append({
             "question": question,
-            "answer": answer
+            "answer": answer,
+            **tutoring
         })
         previous_conversation += f"\nStudent: {question}\nTeacher: {answer}"
     
@@ -132,6 +225,11 @@ def generate_dialog_for_section(section, model_name, turns=12):
 
 
 def process_json_data(json_data, turns=12):
+    with start_span("book2dial.process_json_data", turns=turns):
+        return _process_json_data(json_data, turns)
+
+
+def _process_json_data(json_data, turns=12):
     print(f"[Book2Dial] Starting dialog generation from JSON data")
     
     all_dialogs = []
@@ -141,13 +239,19 @@ def process_json_data(json_data, turns=12):
         print(f"[Book2Dial] Processing section {idx + 1}/{total_sections}: {section.get('title', 'Unknown section')}")
         
         try:
-            dialogs = generate_dialog_for_section(section, model_name, turns)
+            index = build_index(section_passages(section))
+            with time_stage("dialog_section"), start_span("book2dial.section", section=idx + 1, title=section.get("title", "")):
+                dialogs = generate_dialog_for_section(section, model_name, turns, index=index)
             dialog_data = {
                 "title": section["title"],
                 "context": section["paragraphs"][0]['context'] if section.get("paragraphs") else "",
+                # Devices put only the top-k passages for each question into their prompts.
+                "retrieval": index,
                 "dialogs": dialogs
             }
             all_dialogs.append(dialog_data)
+        except BudgetExceeded:
+            raise
         except Exception as e:
             print(f"[Book2Dial] Error processing section {idx + 1}: {str(e)}")
             continue
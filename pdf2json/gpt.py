@@ -4,8 +4,11 @@ import json
 import shutil
 import random
 import uuid
-from time import sleep
+from time import sleep, perf_counter
 from pprint import pprint
+from metrics import time_stage
+from tracing import start_span, record_usage
+from usage import record_call, BudgetExceeded
 from .util import parse_json_string, process_image_to_json, resize_images, encode_images
 from .util import split_images, extract_pages_as_images, clean_up_tmp_images_folder
 from .util import get_image_files, process_text_to_structured_json
@@ -29,11 +32,19 @@ def process(filename, folder, api_key, user_prompt: str = None,
     Returns:
         dict: The combined JSON data structure containing all extracted information.
     """
-    os.chdir(folder)
+    with start_span("pdf2json.process", filename=filename, model=model):
+        return _process(filename, folder, api_key, user_prompt, model, verbose, cleanup)
+
+
+def _process(filename, folder, api_key, user_prompt: str = None,
+             model: str = "gpt-4.1", verbose: bool = False, cleanup: bool = True):
+    # Paths are built from `folder` rather than changing the working directory,
+    # which is shared by every ingestion running in the process.
     basename = os.path.basename(filename)
     file_title = os.path.splitext(basename)[0] 
+    pdf_path = os.path.join(folder, filename)
 
-    tmp_images_folder = f"./{basename}_tmp_images"
+    tmp_images_folder = os.path.join(folder, f"{basename}_tmp_images")
     shutil.rmtree(tmp_images_folder, ignore_errors=True)
     os.makedirs(tmp_images_folder, exist_ok=True)
     
@@ -42,8 +53,10 @@ def process(filename, folder, api_key, user_prompt: str = None,
     
     if verbose:
         print(f"[PDF Processing] Extracting images from PDF file")
-    image_encodings, image_files, filaname_image = do_images(
-        filename, tmp_images_folder, verbose=verbose)
+    with time_stage("pdf_render"), start_span("pdf_render") as span:
+        image_encodings, image_files, filaname_image = do_images(
+            pdf_path, tmp_images_folder, verbose=verbose)
+        span.set_attribute("images", len(image_encodings))
 
     headers = {
         'Content-Type': 'application/json',
@@ -133,8 +146,13 @@ def process(filename, folder, api_key, user_prompt: str = None,
             had_errors = False
             json_file_data = None
 
-            response_dict = process_image_to_json(
-                image_encoding, prompt, headers, model)
+            with time_stage("vision_page"), start_span("llm.vision_page", page=index + 1) as span:
+                started = perf_counter()
+                response_dict = process_image_to_json(
+                    image_encoding, prompt, headers, model)
+                record_usage(span, response_dict.get("usage"), model)
+                record_call("vision_page", model, response_dict.get("usage"),
+                            perf_counter() - started, images=1)
 
             if "error" in response_dict.keys():
                 if verbose:
@@ -159,8 +177,9 @@ def process(filename, folder, api_key, user_prompt: str = None,
         if verbose:
             print(f"[PDF Processing] Creating combined structured JSON from {len(all_extracted_data)} processed images")
             
-        combined_json = create_combined_json(
-            all_extracted_data, file_title, all_text_content, headers, model, verbose=verbose)
+        with time_stage("structuring"), start_span("structuring", pages=len(all_extracted_data)):
+            combined_json = create_combined_json(
+                all_extracted_data, file_title, all_text_content, headers, model, verbose=verbose)
 
         if cleanup:
             if verbose:
@@ -356,7 +375,11 @@ def create_combined_json(extracted_data, title, all_text_content, headers, model
         
         # We might need to truncate the text if it's too long for the model's context
         try:
-            response = process_text_to_structured_json(structure_prompt, headers, model)
+            with time_stage("structuring_llm"), start_span("llm.structuring") as span:
+                started = perf_counter()
+                response = process_text_to_structured_json(structure_prompt, headers, model)
+                record_usage(span, response.get("usage"), model)
+                record_call("structuring", model, response.get("usage"), perf_counter() - started)
             
             if "error" not in response:
                 structured_json = parse_json_string(response["choices"][0]["message"]["content"])
@@ -365,6 +388,8 @@ def create_combined_json(extracted_data, title, all_text_content, headers, model
                 else:
                     if verbose:
                         print("Failed to parse structured JSON from response, using default structure")
+        except BudgetExceeded:
+            raise
         except Exception as e:
             if verbose:
                 print(f"Error processing text to structured JSON: {e}")
@@ -415,7 +440,7 @@ def do_images(filename, tmp_images_folder, verbose=False):
     Extracts images from a PDF file and performs various operations on them.
 
     Args:
-        filename (str): The name of the PDF file.
+        filename (str): The path of the PDF file.
         tmp_images_folder (str): The directory for temporary image storage.
         verbose (bool, optional): Whether to print verbose output. Defaults to False.
 
@@ -427,7 +452,7 @@ def do_images(filename, tmp_images_folder, verbose=False):
     if verbose:
         print(f"Extracting images from the PDF '{filename}'...")
 
-    filaname_image = ''.join(e for e in filename if e.isalnum())
+    filaname_image = ''.join(e for e in os.path.basename(filename) if e.isalnum())
 
     try:
         extract_pages_as_images(filename, tmp_images_folder, filaname_image)
@@ -0,0 +1,73 @@
+"""
+Optional ingestion stage that renders the fixed lesson utterances with Piper.
+
+The explanations and hints produced by book2dial are the same on every device,
+so they are synthesized once here and packed into one audio bundle per section
+(see `raspberry/audio_bundle.py`) that devices download, only for the sections
+they teach, instead of running Piper.
+"""
+
+import os
+import time
+import numpy as np
+from metrics import time_stage
+from tracing import start_span
+from raspberry.audio_bundle import build_bundle
+
+
+def lesson_phrases(section):
+    """
+    Collects the fixed utterances of one section.
+
+    Args:
+        section (dict): One entry of `sections` in the output of `book2dial.process_json_data`.
+
+    Returns:
+        list: Unique phrase texts, in lesson order.
+    """
+    phrases = []
+    for turn in section.get("dialogs", []):
+        for text in [turn.get("explanation")] + list(turn.get("hints") or []):
+            if text and text not in phrases:
+                phrases.append(text)
+    return phrases
+
+
+def render_audio_bundles(dialogs, voice_path):
+    """
+    Synthesizes the lesson phrases of every section with the Piper voice at `voice_path`.
+
+    Args:
+        dialogs (dict): The output of `book2dial.process_json_data`.
+        voice_path (str): Path to the Piper `.onnx` voice used by the devices.
+
+    Returns:
+        list: (section index, gzip-compressed bundle bytes, bundle version) for
+        every section with something to render.
+    """
+    from piper.voice import PiperVoice
+
+    sections = [(index, lesson_phrases(section)) for index, section in enumerate(dialogs.get("sections", []))]
+    sections = [(index, phrases) for index, phrases in sections if phrases]
+    if not sections:
+        return []
+
+    bundles = []
+    total_phrases = sum(len(phrases) for _, phrases in sections)
+    with time_stage("audio_bundle"), start_span("tts.render_audio_bundles", phrases=total_phrases):
+        started = time.perf_counter()
+        voice = PiperVoice.load(voice_path)
+        samples_total = 0
+        for index, phrases in sections:
+            rendered = {}
+            for text in phrases:
+                rendered[text] = np.frombuffer(b"".join(voice.synthesize_stream_raw(text)), dtype=np.int16)
+            bundle, version = build_bundle(os.path.basename(voice_path), voice.config.sample_rate, rendered)
+            samples_total += sum(len(samples) for samples in rendered.values())
+            bundles.append((index, bundle, version))
+            print(f"[TTS] Section {index + 1}: {len(phrases)} phrases, bundle {version} is {len(bundle) / 1e6:.1f} MB")
+
+    seconds = samples_total / voice.config.sample_rate
+    print(f"[TTS] Rendered {total_phrases} phrases ({seconds:.0f}s of audio) in {len(bundles)} bundles "
+          f"in {time.perf_counter() - started:.1f}s")
+    return bundles
@@ -8,6 +8,7 @@ import requests
 from PIL import Image
 import pypdfium2 as pdfium
 from split_image import split_image as si
+from tracing import start_span
 
 
 def parse_json_string(json_string, verbose=False):
@@ -70,16 +71,17 @@ def extract_pages_as_images(pdf_file, tmp_images_folder, filaname_image="image")
     pdf = pdfium.PdfDocument(pdf_file)
     n_pages = len(pdf)
     for page_number in range(n_pages):
-        page = pdf.get_page(page_number)
-        image_path = os.path.join(tmp_images_folder, f"{filaname_image}_{page_number+1}.jpg")
-        bitmap = page.render(
-            scale=1,
-            rotation=0,
-            crop=(0, 0, 0, 0)
-        )
-
-        pil_image = bitmap.to_pil()
-        pil_image.save(image_path)
+        with start_span("render_page", page=page_number + 1):
+            page = pdf.get_page(page_number)
+            image_path = os.path.join(tmp_images_folder, f"{filaname_image}_{page_number+1}.jpg")
+            bitmap = page.render(
+                scale=1,
+                rotation=0,
+                crop=(0, 0, 0, 0)
+            )
+
+            pil_image = bitmap.to_pil()
+            pil_image.save(image_path)
 
     return os.listdir(tmp_images_folder)
 
@@ -0,0 +1,192 @@
+"""
+answer_match.py
+
+Local scoring of a child's answer against the expected answers, so confident
+cases are decided in milliseconds and only ambiguous ones go to the LLM.
+
+`score_answer` combines keyword coverage (expected content words found in the
+answer, exactly or with the same stem), whole-answer fuzzy similarity and, if an
+`embed` function is given, embedding cosine similarity. Fuzzy matching cannot
+tell "visible" from "invisible" or "eight" from "eighty", so answers that negate
+an expected word with a prefix or name a different number always go to the LLM.
+`match_answer` turns the score into "correct", "incorrect" or None (ambiguous)
+and reports which path decided it, so the thresholds can be tuned from logs.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+from difflib import SequenceMatcher
+from .asr import STOPWORDS
+
+CORRECT_THRESHOLD = float(os.getenv("ANSWER_CORRECT_THRESHOLD", "0.8"))
+INCORRECT_THRESHOLD = float(os.getenv("ANSWER_INCORRECT_THRESHOLD", "0.15"))
+# Expected answers with more content words than this are explanations (book2dial
+# teacher answers), not key answers: a correct short reply covers only a small
+# part of them, so low coverage says nothing and is never judged incorrect locally.
+MAX_KEY_ANSWER_WORDS = 8
+NEGATIONS = {"no", "not", "non", "never", "none", "nothing", "dont", "don't", "isnt", "isn't", "cant", "can't",
+             "wont", "won't"}
+NEGATING_PREFIXES = ("un", "in", "im", "il", "ir", "non", "dis")
+NUMBER_WORDS = {
+    "zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten", "eleven", "twelve",
+    "thirteen", "fourteen", "fifteen", "sixteen", "seventeen", "eighteen", "nineteen", "twenty", "thirty",
+    "forty", "fifty", "sixty", "seventy", "eighty", "ninety", "hundred", "thousand", "million",
+}
+
+
+def normalize(text):
+    return re.sub(r"\s+", " ", re.sub(r"[^a-z0-9' ]", " ", (text or "").lower())).strip()
+
+
+def content_words(text):
+    return [word for word in normalize(text).split() if word not in STOPWORDS]
+
+
+def _stem(word):
+    for suffix in ("ing", "ed", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def _word_found(word, words):
+    if word in words:
+        return True
+    stem = _stem(word)
+    return any(_stem(other) == stem for other in words)
+
+
+def _contradicts(answer_words, expected_words):
+    """Why the answer may mean the opposite of the expected one, or None."""
+    for word in answer_words - expected_words:
+        for prefix in NEGATING_PREFIXES:
+            if word.startswith(prefix) and _stem(word[len(prefix):]) in {_stem(w) for w in expected_words}:
+                return "negating_prefix"
+    if (answer_words & NUMBER_WORDS) - expected_words or re.findall(r"\d+", " ".join(answer_words - expected_words)):
+        return "different_number"
+    return None
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = (sum(x * x for x in a) ** 0.5) * (sum(y * y for y in b) ** 0.5)
+    return dot / norm if norm else 0.0
+
+
+def score_answer(answer, expected, embed=None):
+    """
+    Returns (score, details) for the best-matching expected answer, with score
+    in [0, 1] and details holding the individual signals.
+    """
+    answer_norm = normalize(answer)
+    answer_words = set(answer_norm.split())
+    best = (0.0, {})
+    for candidate in expected:
+        candidate_norm = normalize(candidate)
+        if not candidate_norm:
+            continue
+        keywords = content_words(candidate) or candidate_norm.split()
+        coverage = sum(_word_found(word, answer_words) for word in keywords) / len(keywords)
+        fuzzy = SequenceMatcher(None, answer_norm, candidate_norm).ratio()
+        details = {
+            "expected": candidate,
+            "coverage": round(coverage, 3),
+            "fuzzy": round(fuzzy, 3),
+            "contains": f" {candidate_norm} " in f" {answer_norm} ",
+        }
+        score = 1.0 if details["contains"] else max(coverage, fuzzy)
+        if embed is not None:
+            details["embedding"] = round(_cosine(embed(answer), embed(candidate)), 3)
+            score = max(score, details["embedding"])
+        if score > best[0] or not best[1]:
+            best = (score, details)
+    return best
+
+
+def match_answer(answer, expected, embed=None, correct_threshold=None, incorrect_threshold=None):
+    """
+    Decides confident cases locally. Returns (verdict, decision) where verdict is
+    "correct", "incorrect" or None when the LLM should decide, and decision is a
+    dict describing the path taken.
+    """
+    correct_threshold = CORRECT_THRESHOLD if correct_threshold is None else correct_threshold
+    incorrect_threshold = INCORRECT_THRESHOLD if incorrect_threshold is None else incorrect_threshold
+    started = time.perf_counter()
+    score, details = score_answer(answer, [e for e in expected if e], embed=embed)
+
+    # "It is not a liquid" overlaps "liquid" perfectly, so a negation the expected
+    # answer does not contain always goes to the LLM, as do "unsafe" for "safe"
+    # and "eight" for "eighty".
+    answer_words = set(normalize(answer).split())
+    expected_words = set(normalize(details.get("expected", "")).split())
+    negated = bool((answer_words - expected_words) & NEGATIONS)
+    contradiction = _contradicts(answer_words, expected_words)
+
+    key_answer = len(content_words(details.get("expected", ""))) <= MAX_KEY_ANSWER_WORDS
+
+    if score >= correct_threshold and not negated and not contradiction:
+        verdict, reason = "correct", "score_above_correct_threshold"
+    elif score <= incorrect_threshold and key_answer and not contradiction:
+        verdict, reason = "incorrect", "score_below_incorrect_threshold"
+    else:
+        verdict, reason = None, "negation" if negated else contradiction or "ambiguous"
+
+    decision = {
+        "path": "local" if verdict else "llm",
+        "reason": reason,
+        "score": round(score, 3),
+        "ms": round((time.perf_counter() - started) * 1000, 2),
+        **details,
+    }
+    return verdict, decision
+
+
+def report(answer, verdict, decision):
+    """Prints the decision and, if ANSWER_MATCH_LOG is set, appends it as a JSON line."""
+    print(f"[Eval] path={decision['path']} reason={decision['reason']} score={decision['score']} "
+          f"verdict={verdict} ({decision['ms']} ms)")
+    log_path = os.getenv("ANSWER_MATCH_LOG")
+    if log_path:
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"answer": answer, "verdict": verdict, **decision}) + "\n")
+
+
+# Teacher answers as book2dial writes them, with replies a child actually gives.
+# Expected verdicts: "correct"/"incorrect" must be decided locally, None must go to the LLM.
+CHECKS = [
+    ("Plants make their own food through a process called photosynthesis. They use sunlight, water from the "
+     "soil and carbon dioxide from the air to make sugar, and they give off oxygen that we breathe.",
+     [("photosynthesis", None), ("sunlight and water", None), ("I don't know", None),
+      ("plants make their own food through a process called photosynthesis they use sunlight water from the soil "
+       "and carbon dioxide from the air to make sugar and they give off oxygen that we breathe", "correct")]),
+    ("Water turns into ice when it gets very cold. This happens at zero degrees Celsius, which is called the "
+     "freezing point, and the liquid water becomes a solid.",
+     [("it freezes", None), ("zero degrees", None), ("it is not a liquid", None)]),
+    ("Blue", [("blue", "correct"), ("it is blue", "correct"), ("a dog", "incorrect"), ("not blue", None)]),
+    ("Eighty", [("eighty", "correct"), ("eight", None), ("80", None)]),
+    ("Visible", [("visible", "correct"), ("invisible", None)]),
+    ("Magnetic", [("magnetic", "correct"), ("nonmagnetic", None), ("non magnetic", None)]),
+    ("Safe", [("safe", "correct"), ("unsafe", None)]),
+    ("Transparent", [("transparent", "correct"), ("non-transparent", None)]),
+    ("Plants need sunlight", [("plant needs sunlight", "correct"), ("plants needed sunlight", "correct")]),
+]
+
+
+def self_check():
+    """Runs CHECKS and returns the number of mismatches."""
+    failures = 0
+    for expected, cases in CHECKS:
+        for answer, want in cases:
+            verdict, decision = match_answer(answer, [expected])
+            ok = verdict == want
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {answer[:40]!r:<44} verdict={verdict} want={want} "
+                  f"score={decision['score']} reason={decision['reason']}")
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if self_check() else 0)
@@ -0,0 +1,337 @@
+"""
+asr.py
+
+Speech recognition for the Raspberry Pi assistant.
+
+Backends implement `transcribe(audio, prompt)` returning timed segments:
+`FasterWhisperASR` runs CTranslate2 int8 models (fast on ARM, no torch) and
+`WhisperASR` wraps openai-whisper; `make_asr` picks one and falls back when a
+backend is not installed. Both decode greedily with a fixed language and no
+temperature fallback, which suits short child answers, and take the expected
+answer vocabulary as initial prompt. `IncrementalTranscriber` runs a backend
+on a worker thread while the child is still speaking: each pass transcribes the
+audio after the last committed point, and segments that come out identical in
+two consecutive passes are committed and dropped from later windows. At end of
+speech only the uncommitted tail is transcribed, or the last (or still running)
+pass is reused when it covers everything but the trailing silence. A running pass
+that does not is abandoned rather than waited for, on backends that can be
+called from two threads (`thread_safe`).
+"""
+
+import os
+import re
+import sys
+import time
+import threading
+
+
+class Segment:
+    def __init__(self, start, end, text):
+        self.start = start
+        self.end = end
+        self.text = text
+
+
+def segments_text(segments):
+    return " ".join(segment.text for segment in segments if segment.text).strip()
+
+
+def _normalize(text):
+    return re.sub(r"[^a-z0-9' ]", "", text.lower()).strip()
+
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in", "is", "it",
+    "its", "of", "on", "or", "that", "the", "their", "they", "this", "to", "was", "were", "will", "with",
+}
+
+
+def vocabulary_prompt(texts, max_words=40):
+    """Builds a Whisper initial prompt from the words the child is expected to use."""
+    words = []
+    seen = set()
+    for text in texts:
+        for word in re.findall(r"[A-Za-z']+", text or ""):
+            key = word.lower()
+            if key in STOPWORDS or key in seen or len(key) < 3:
+                continue
+            seen.add(key)
+            words.append(word)
+            if len(words) >= max_words:
+                return ", ".join(words)
+    return ", ".join(words) or None
+
+
+class WhisperASR:
+    name = "whisper"
+    thread_safe = False
+
+    def __init__(self, model_name="base.en", language="en"):
+        import whisper
+        self.model = whisper.load_model(model_name)
+        self.language = language
+
+    def transcribe(self, audio, prompt=None):
+        result = self.model.transcribe(
+            audio,
+            fp16=False,
+            language=self.language,
+            temperature=0.0,
+            initial_prompt=prompt,
+            condition_on_previous_text=False,
+        )
+        return [Segment(s["start"], s["end"], s["text"].strip()) for s in result["segments"]]
+
+
+class FasterWhisperASR:
+    name = "faster-whisper"
+    # CTranslate2 models accept concurrent calls; two workers let a final pass run
+    # alongside an abandoned incremental one instead of queueing behind it.
+    thread_safe = True
+
+    def __init__(self, model_name="base.en", language="en", compute_type="int8", threads=None):
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(
+            model_name,
+            device="cpu",
+            compute_type=compute_type,
+            cpu_threads=threads or os.cpu_count() or 4,
+            num_workers=2,
+        )
+        self.language = language
+
+    def transcribe(self, audio, prompt=None):
+        segments, _ = self.model.transcribe(
+            audio,
+            language=self.language,
+            beam_size=1,
+            best_of=1,
+            temperature=0.0,
+            initial_prompt=prompt,
+            condition_on_previous_text=False,
+            vad_filter=False,
+        )
+        return [Segment(s.start, s.end, s.text.strip()) for s in segments]
+
+
+BACKENDS = {
+    "faster-whisper": FasterWhisperASR,
+    "whisper": WhisperASR,
+}
+
+
+def make_asr(backend="faster-whisper", model_name="base.en"):
+    """Loads the requested backend, falling back to the others if it is not installed."""
+    order = [backend] + [name for name in BACKENDS if name != backend]
+    for name in order:
+        try:
+            asr = BACKENDS[name](model_name)
+            print(f"[ASR] Using {name} backend with model {model_name}")
+            return asr
+        except ImportError as e:
+            print(f"[ASR] Backend {name} unavailable ({e})")
+    raise RuntimeError("No ASR backend is installed")
+
+
+class IncrementalTranscriber:
+    def __init__(self, asr, convert=None, sample_rate=16000, step_seconds=1.0, min_window_seconds=1.0,
+                 prompt=None):
+        self.asr = asr
+        self.convert = convert or (lambda audio: audio)
+        self.sample_rate = sample_rate
+        self.step_seconds = step_seconds
+        self.min_window = int(min_window_seconds * sample_rate)
+        self.prompt = prompt
+
+        self._lock = threading.Lock()
+        self._latest = None
+        self._updated = threading.Event()
+        self._stopped = threading.Event()
+        self._committed = []
+        self._committed_samples = 0
+        # (audio length the pass covered, uncommitted segments it produced)
+        self._last_pass = None
+        # Audio length of the pass running right now, if any.
+        self._in_flight = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def update(self, audio):
+        """Hands over the utterance captured so far (a view; converted lazily)."""
+        with self._lock:
+            self._latest = audio
+        self._updated.set()
+
+    def _stop(self):
+        """Stops further passes; returns the audio length of the pass still running, or None."""
+        with self._lock:
+            self._stopped.set()
+            in_flight = self._in_flight
+        self._updated.set()
+        return in_flight
+
+    def cancel(self):
+        if self._stop() is not None and not getattr(self.asr, "thread_safe", False):
+            # The next utterance must not call the model while this pass still uses it.
+            self._thread.join()
+
+    def finish(self, audio, trailing_silence=0):
+        """
+        Returns the full transcript of `audio` (16 kHz), the complete utterance.
+        `trailing_silence` is the number of silent samples the VAD appended.
+        """
+        started = time.perf_counter()
+        in_flight = self._stop()
+        covers = lambda length: length is not None and len(audio) - length <= trailing_silence
+        if covers(in_flight):
+            # The running pass already hears the whole utterance: finishing it is the final pass.
+            self._thread.join()
+        elif in_flight is not None and not getattr(self.asr, "thread_safe", False):
+            self._thread.join()
+        # No commits happen once stopped, so the committed state is final here.
+        tail = audio[self._committed_samples:]
+        if self._last_pass is not None and covers(self._last_pass[0]):
+            segments = self._last_pass[1]
+            source = "reused"
+        elif len(tail) > 0:
+            segments = self.asr.transcribe(tail, prompt=self._prompt())
+            source = "tail"
+        else:
+            segments = []
+            source = "empty"
+        text = segments_text(self._committed + segments)
+        print(f"[ASR] Finalized ({source}, {len(self._committed)} committed segments) "
+              f"in {time.perf_counter() - started:.2f}s")
+        return text
+
+    def _prompt(self):
+        committed = segments_text(self._committed)
+        if self.prompt and committed:
+            return f"{self.prompt} {committed}"
+        return self.prompt or committed or None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._updated.wait()
+            self._updated.clear()
+            if self._stopped.is_set():
+                return
+            with self._lock:
+                latest = self._latest
+            if latest is None:
+                continue
+            audio = self.convert(latest)
+            window = audio[self._committed_samples:]
+            if len(window) < self.min_window:
+                continue
+            with self._lock:
+                if self._stopped.is_set():
+                    return
+                self._in_flight = len(audio)
+
+            started = time.perf_counter()
+            segments = self.asr.transcribe(window, prompt=self._prompt())
+            with self._lock:
+                self._in_flight = None
+                if self._stopped.is_set():
+                    # finish() may reuse this pass, but never sees a commit it did not expect.
+                    if self._last_pass is None or len(audio) > self._last_pass[0]:
+                        self._last_pass = (len(audio), segments)
+                    return
+                self._commit_stable(segments)
+                self._last_pass = (len(audio), segments)
+
+            # Pace passes so transcription never saturates the CPU the capture needs.
+            elapsed = time.perf_counter() - started
+            self._stopped.wait(max(0.0, self.step_seconds - elapsed))
+
+    def _commit_stable(self, segments):
+        previous = self._last_pass[1] if self._last_pass else []
+        stable = 0
+        # The last segment may still be growing, so it is never committed early.
+        for current, before in zip(segments[:-1], previous):
+            if _normalize(current.text) != _normalize(before.text):
+                break
+            stable += 1
+        if not stable:
+            return
+        self._committed.extend(segments[:stable])
+        self._committed_samples += int(segments[stable - 1].end * self.sample_rate)
+        # The remaining segments are now relative to the new committed point.
+        offset = segments[stable - 1].end
+        segments[:] = [Segment(s.start - offset, s.end - offset, s.text) for s in segments[stable:]]
+
+
+def word_error_rate(reference, hypothesis):
+    ref = _normalize(reference).split()
+    hyp = _normalize(hypothesis).split()
+    if not ref:
+        return float(len(hyp) > 0)
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def benchmark(paths, backends=("faster-whisper", "whisper"), model_name="base.en"):
+    """
+    Transcribes 16 kHz WAV fixtures with each backend and reports the real-time
+    factor and, where a `<name>.txt` reference exists, the word error rate.
+    An optional `<name>.prompt.txt` is used as the vocabulary prompt.
+    """
+    from .vad import read_wav
+
+    fixtures = []
+    for path in paths:
+        audio, sample_rate = read_wav(path)
+        if sample_rate != 16000:
+            print(f"[ASR] Skipping {path}: fixtures must be 16 kHz, got {sample_rate}")
+            continue
+        base = os.path.splitext(path)[0]
+        reference = prompt = None
+        if os.path.exists(base + ".txt"):
+            with open(base + ".txt", "r", encoding="utf-8") as f:
+                reference = f.read().strip()
+        if os.path.exists(base + ".prompt.txt"):
+            with open(base + ".prompt.txt", "r", encoding="utf-8") as f:
+                prompt = f.read().strip()
+        fixtures.append((os.path.basename(path), audio, reference, prompt))
+
+    results = []
+    for backend in backends:
+        try:
+            asr = BACKENDS[backend](model_name)
+        except ImportError as e:
+            print(f"[ASR] Skipping {backend}: {e}")
+            continue
+        # The first call pays one-off initialization, keep it out of the numbers.
+        if fixtures:
+            asr.transcribe(fixtures[0][1][:16000])
+        for name, audio, reference, prompt in fixtures:
+            started = time.perf_counter()
+            text = segments_text(asr.transcribe(audio, prompt=prompt))
+            elapsed = time.perf_counter() - started
+            results.append({
+                "backend": backend,
+                "file": name,
+                "rtf": elapsed / (len(audio) / 16000),
+                "wer": word_error_rate(reference, text) if reference is not None else None,
+                "text": text,
+            })
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m raspberry.asr fixture.wav [fixture.wav ...]")
+        sys.exit(1)
+    for result in benchmark(sys.argv[1:]):
+        wer = "-" if result["wer"] is None else f"{result['wer']:.2%}"
+        print(f"{result['backend']:<15} {result['file']:<32} RTF {result['rtf']:.3f}  WER {wer}  {result['text']}")
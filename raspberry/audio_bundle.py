@@ -0,0 +1,90 @@
+"""
+audio_bundle.py
+
+Pre-rendered lesson audio, produced once on the server and played on devices.
+
+Every book section gets its own bundle, so a device downloads only the audio of
+the sections it teaches. A bundle is one file: an 8-byte magic, a little-endian uint32 index length, a
+JSON index and then the int16 mono PCM of every phrase back to back. The index
+holds the format version, the Piper voice and sample rate, and for every phrase
+(keyed like `PhraseCache`, by voice and text) its sample offset and length.
+Bundles travel gzip-compressed; the device stores them uncompressed so the PCM
+can be memory-mapped and played without copying the whole file into RAM.
+"""
+
+import os
+import gzip
+import json
+import struct
+import hashlib
+import numpy as np
+
+MAGIC = b"SPAUDIO1"
+FORMAT_VERSION = 1
+
+
+def phrase_key(voice_id, text):
+    """Key of a phrase rendered with `voice_id`; shared by bundles and `PhraseCache`."""
+    return hashlib.sha1(f"{voice_id}\0{text}".encode("utf-8")).hexdigest()
+
+
+def build_bundle(voice_id, sample_rate, phrases):
+    """
+    Packs {text: int16 samples} into bundle bytes. Returns (gzip-compressed
+    bytes, version), where the version is a hash of the uncompressed content.
+    """
+    entries = {}
+    chunks = []
+    offset = 0
+    for text, samples in phrases.items():
+        samples = np.asarray(samples, dtype="<i2")
+        entries[phrase_key(voice_id, text)] = [offset, len(samples)]
+        chunks.append(samples.tobytes())
+        offset += len(samples)
+    index = json.dumps({
+        "format": FORMAT_VERSION,
+        "voice": voice_id,
+        "sample_rate": sample_rate,
+        "entries": entries,
+    }).encode("utf-8")
+    raw = MAGIC + struct.pack("<I", len(index)) + index + b"".join(chunks)
+    version = hashlib.sha1(raw).hexdigest()[:16]
+    return gzip.compress(raw, compresslevel=6), version
+
+
+def install_bundle(compressed, path):
+    """Decompresses downloaded bundle bytes to `path` atomically."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(gzip.decompress(compressed))
+    os.replace(tmp_path, path)
+
+
+class AudioBundle:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            header = f.read(len(MAGIC) + 4)
+            if header[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not an audio bundle")
+            (index_length,) = struct.unpack("<I", header[len(MAGIC):])
+            index = json.loads(f.read(index_length).decode("utf-8"))
+        if index.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported audio bundle format {index.get('format')}")
+        self.voice_id = index["voice"]
+        self.sample_rate = index["sample_rate"]
+        self._entries = index["entries"]
+        data_offset = len(header) + index_length
+        total = sum(length for _, length in self._entries.values())
+        self._pcm = np.memmap(path, dtype="<i2", mode="r", offset=data_offset, shape=(total,)) if total else None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Samples for a phrase key as a read-only view into the mapped file, or None."""
+        entry = self._entries.get(key)
+        if entry is None or self._pcm is None:
+            return None
+        offset, length = entry
+        return self._pcm[offset:offset + length]
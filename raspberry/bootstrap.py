@@ -0,0 +1,76 @@
+"""
+bootstrap.py
+
+Concurrent start-up for the Raspberry Pi assistant.
+
+Each boot task (ASR model, Piper voice, microphone, dialog fetch, LLM preload)
+runs on its own thread as soon as the script starts; callers `wait()` only for
+the pieces they are about to use, so the welcome message can play while the
+ASR model is still loading. Task durations, time-to-first-utterance and peak
+RSS are logged on every boot.
+"""
+
+import time
+import resource
+import threading
+
+
+class BootError(RuntimeError):
+    """A boot task failed; the device cannot run without it, so this is not retried."""
+
+    def __init__(self, name, error):
+        super().__init__(f"Boot task {name} failed: {error}")
+        self.name = name
+        self.error = error
+
+
+class Bootstrap:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._tasks = {}
+        self._first_utterance = None
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def start(self, name, fn, *args):
+        """Runs `fn(*args)` on a daemon thread; its result is available from `wait(name)`."""
+        task = {"done": threading.Event(), "result": None, "error": None}
+        self._tasks[name] = task
+
+        def run():
+            started = time.perf_counter()
+            try:
+                task["result"] = fn(*args)
+                print(f"[Boot] {name} ready in {time.perf_counter() - started:.2f}s")
+            except Exception as e:
+                task["error"] = e
+                print(f"[Boot] {name} failed after {time.perf_counter() - started:.2f}s: {e}")
+            finally:
+                task["done"].set()
+
+        threading.Thread(target=run, name=f"boot-{name}", daemon=True).start()
+
+    def wait(self, name):
+        """Blocks until task `name` has finished and returns its result; raises `BootError` if it failed."""
+        task = self._tasks[name]
+        if not task["done"].is_set():
+            started = time.perf_counter()
+            task["done"].wait()
+            print(f"[Boot] Waited {time.perf_counter() - started:.2f}s for {name}")
+        if task["error"] is not None:
+            raise BootError(name, task["error"]) from task["error"]
+        return task["result"]
+
+    def ready(self, name):
+        task = self._tasks.get(name)
+        return task is not None and task["done"].is_set() and task["error"] is None
+
+    def first_utterance(self):
+        """Logs time-to-first-utterance once per boot."""
+        if self._first_utterance is not None:
+            return
+        self._first_utterance = self.elapsed()
+        # ru_maxrss is in KiB on Linux.
+        print(f"[Boot] Time to first utterance {self._first_utterance:.2f}s, "
+              f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
@@ -0,0 +1,205 @@
+"""
+capture.py
+
+Persistent microphone capture for the Raspberry Pi assistant.
+
+The input device is opened once per session, preferably as 16 kHz mono int16
+which is exactly what Whisper expects. The PortAudio callback converts every
+block to float32 straight into a preallocated mirrored ring buffer: each sample
+is written at `i` and `i + capacity`, so any window of up to `capacity` samples
+is a contiguous slice and the recorded utterance is handed to the ASR as a view.
+Devices that only offer 44.1/48 kHz are resampled with the NumPy polyphase
+filter in `resample.py`.
+"""
+
+import time
+import threading
+import numpy as np
+import pyaudio
+from .vad import EnergyVAD
+from .resample import PolyphaseResampler
+
+TARGET_RATE = 16000
+FALLBACK_RATES = (48000, 44100)
+
+
+class CaptureEngine:
+    def __init__(self, chunk=512, buffer_seconds=30, device_index=None, vad=None):
+        self.pa = pyaudio.PyAudio()
+        self.device_index = device_index
+        self.rate, self.channels = self._pick_format()
+        self.chunk = chunk if self.rate == TARGET_RATE else int(chunk * self.rate / TARGET_RATE)
+        self._capacity = int(self.rate * buffer_seconds)
+        self._ring = np.zeros(2 * self._capacity, dtype=np.float32)
+        self._written = 0
+        self._listening = False
+        self._cond = threading.Condition()
+        self._resampler = None if self.rate == TARGET_RATE else PolyphaseResampler(self.rate, TARGET_RATE)
+        self.vad = vad or EnergyVAD(self.rate, self.chunk)
+        # Why the last `record()` stopped: "speech_end", "max_duration", "no_speech" or "timeout".
+        self.stop_reason = None
+
+        self.stream = self.pa.open(
+            format=pyaudio.paInt16,
+            channels=self.channels,
+            rate=self.rate,
+            frames_per_buffer=self.chunk,
+            input=True,
+            input_device_index=device_index,
+            stream_callback=self._callback,
+        )
+        self.stream.start_stream()
+        print(f"[Capture] Input opened at {self.rate} Hz, {self.channels} channel(s)")
+
+    def _supported(self, rate, channels):
+        try:
+            return self.pa.is_format_supported(
+                rate,
+                input_device=self.device_index if self.device_index is not None
+                else self.pa.get_default_input_device_info()["index"],
+                input_channels=channels,
+                input_format=pyaudio.paInt16,
+            )
+        except ValueError:
+            return False
+
+    def _pick_format(self):
+        for rate in (TARGET_RATE,) + FALLBACK_RATES:
+            for channels in (1, 2):
+                if self._supported(rate, channels):
+                    return rate, channels
+        return 44100, 2
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        if not self._listening:
+            return (None, pyaudio.paContinue)
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        if self.channels > 1:
+            # Strided view of the first channel, no copy.
+            samples = samples[::self.channels]
+        with self._cond:
+            self._store(samples)
+            self._cond.notify_all()
+        return (None, pyaudio.paContinue)
+
+    def _store(self, samples):
+        count = len(samples)
+        pos = self._written % self._capacity
+        first = min(count, self._capacity - pos)
+        for offset in (0, self._capacity):
+            np.multiply(samples[:first], 1.0 / 32768, out=self._ring[offset + pos:offset + pos + first],
+                        casting="unsafe")
+            if count > first:
+                np.multiply(samples[first:], 1.0 / 32768, out=self._ring[offset:offset + count - first],
+                            casting="unsafe")
+        self._written += count
+
+    def listen(self):
+        """Starts capturing into the ring and returns the current sample position."""
+        with self._cond:
+            self._listening = True
+            return self._written
+
+    def pause(self):
+        """Stops writing, so views handed out stay valid while they are transcribed."""
+        with self._cond:
+            self._listening = False
+            self._cond.notify_all()
+
+    def read_block(self, position, timeout=1.0):
+        """
+        Waits until `self.chunk` samples past `position` are available and returns
+        them as a view, or None on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._written - position < self.chunk:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._listening:
+                    return None
+                self._cond.wait(remaining)
+        return self.view(position, position + self.chunk)
+
+    def view(self, start, end):
+        """Contiguous view of samples [start, end) at the capture rate."""
+        if end - start > self._capacity:
+            start = end - self._capacity
+        offset = start % self._capacity
+        return self._ring[offset:offset + (end - start)]
+
+    def to_asr_input(self, audio):
+        """Returns `audio` at 16 kHz; a no-op when the device captures at 16 kHz."""
+        if self.rate == TARGET_RATE:
+            return audio
+        return self._resampler(audio)
+
+    def record(self, vad=None, max_seconds=10, no_speech_seconds=8, on_speech=None):
+        """
+        Records one answer and returns it as float32 mono at 16 kHz (empty if the
+        child never spoke). The utterance starts `vad.lookback_samples` before
+        speech was detected and ends as soon as the detector reports end of speech,
+        after `max_seconds` of speech, or after `no_speech_seconds` of waiting.
+
+        `on_speech`, if given, is called after every block once speech has started
+        with a view of the utterance so far at the capture rate.
+        """
+        vad = vad or self.vad
+        vad.reset()
+        print("Recording")
+        start = self.listen()
+        position = start
+        speech_start = None
+        max_samples = int(max_seconds * self.rate)
+        no_speech_samples = int(no_speech_seconds * self.rate)
+        # Wall-clock guard in case the device stops delivering audio.
+        deadline = time.monotonic() + no_speech_seconds + max_seconds + 2
+
+        print("Please start speaking...")
+        self.stop_reason = "timeout"
+        try:
+            while time.monotonic() < deadline:
+                block = self.read_block(position)
+                if block is None:
+                    continue
+                position += len(block)
+                event = vad.process(block)
+                if event == "speech_start":
+                    speech_start = max(start, position - vad.lookback_samples)
+                elif event == "speech_end":
+                    print("End of speech detected, stopping recording")
+                    self.stop_reason = "speech_end"
+                    break
+                if speech_start is None and position - start >= no_speech_samples:
+                    print("No speech detected")
+                    self.stop_reason = "no_speech"
+                    break
+                if speech_start is not None and position - speech_start >= max_samples:
+                    print("Maximum recording duration reached")
+                    self.stop_reason = "max_duration"
+                    break
+                if speech_start is not None and on_speech is not None:
+                    on_speech(self.view(speech_start, position))
+        finally:
+            self.pause()
+
+        print("Finished recording")
+        if speech_start is None:
+            return np.zeros(0, dtype=np.float32)
+        return self.to_asr_input(self.view(speech_start, position))
+
+    def trailing_silence(self, vad=None):
+        """
+        Silent samples (at 16 kHz) the last recording ends with: the VAD hangover
+        if it stopped on end of speech, 0 if it was cut while the child may still
+        have been talking.
+        """
+        if self.stop_reason != "speech_end":
+            return 0
+        vad = vad or self.vad
+        return int(getattr(vad, "hangover_frames", 0) * self.chunk * TARGET_RATE / self.rate)
+
+    def close(self):
+        self.pause()
+        self.stream.stop_stream()
+        self.stream.close()
+        self.pa.terminate()
@@ -0,0 +1,109 @@
+"""
+lesson_pool.py
+
+On-device pool of validated chat-mode lessons.
+
+Lessons are stored per (parent prompt, level) in one JSON file. `take()`
+returns the next lesson in rotation, so repeated sessions on the same prompt
+start instantly and do not replay the same lesson every time. The pool is
+filled from the lessons the server pre-generated and from lessons the local
+model writes in the background for the next session.
+
+`lesson_prompt` and `validate_lesson` are also used by the server
+(`lessons.py`), so both sides write and accept lessons the same way.
+"""
+
+import os
+import json
+import hashlib
+import threading
+
+
+def lesson_prompt(parent_prompt, level):
+    return (
+        "You are an expert English language curriculum designer. Create an engaging conversational English "
+        f"lesson appropriate for a non-English speaking child on the topic of {parent_prompt}.\n\n"
+        f"Create a short English conversation practice lesson for {level} level students. The lesson should "
+        "focus on practical, everyday English conversation skills and contain 4 to 6 conversations. Return only "
+        "a JSON object with the following structure:\n\n"
+        f'{{"title": "Lesson title", "level": "{level}", "conversations": [{{"prompt": "Question or instruction '
+        'for student", "expected_responses": ["possible response 1", "possible response 2"], "follow_up": '
+        '"Encouraging feedback and additional information"}]}'
+    )
+
+
+def validate_lesson(data, level=None):
+    """Returns the lesson with only the fields the session uses, or None if it is unusable."""
+    if not isinstance(data, dict):
+        return None
+    conversations = []
+    for item in data.get("conversations") or []:
+        if not isinstance(item, dict):
+            continue
+        prompt = str(item.get("prompt") or "").strip()
+        responses = [str(r).strip() for r in item.get("expected_responses") or [] if str(r).strip()]
+        follow_up = str(item.get("follow_up") or "").strip()
+        if prompt and responses and follow_up:
+            conversations.append({"prompt": prompt, "expected_responses": responses, "follow_up": follow_up})
+    if len(conversations) < 2:
+        return None
+    return {
+        "title": str(data.get("title") or "English practice").strip(),
+        "level": level or str(data.get("level") or "Beginner"),
+        "conversations": conversations,
+    }
+
+
+class LessonPool:
+    def __init__(self, path, max_per_key=6):
+        self.path = path
+        self.max_per_key = max_per_key
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._pools = json.load(f)
+        except (OSError, ValueError):
+            self._pools = {}
+
+    @staticmethod
+    def key(parent_prompt, level):
+        text = " ".join((parent_prompt or "").lower().split())
+        return hashlib.sha1(f"{text}\0{level.lower()}".encode("utf-8")).hexdigest()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._pools, f)
+        os.replace(tmp_path, self.path)
+
+    def count(self, parent_prompt, level):
+        with self._lock:
+            return len(self._pools.get(self.key(parent_prompt, level), {}).get("lessons", []))
+
+    def add(self, parent_prompt, level, lesson):
+        """Validates and stores a lesson; returns False if it was unusable or already pooled."""
+        lesson = validate_lesson(lesson, level)
+        if lesson is None:
+            return False
+        with self._lock:
+            pool = self._pools.setdefault(self.key(parent_prompt, level), {"next": 0, "lessons": []})
+            if lesson in pool["lessons"]:
+                return False
+            pool["lessons"].append(lesson)
+            # Oldest lessons make room for new ones.
+            del pool["lessons"][:-self.max_per_key]
+            pool["next"] %= len(pool["lessons"])
+            self._save()
+        return True
+
+    def take(self, parent_prompt, level):
+        """Returns the next lesson for (prompt, level) in rotation, or None if the pool is empty."""
+        with self._lock:
+            pool = self._pools.get(self.key(parent_prompt, level))
+            if not pool or not pool["lessons"]:
+                return None
+            lesson = pool["lessons"][pool["next"] % len(pool["lessons"])]
+            pool["next"] = (pool["next"] + 1) % len(pool["lessons"])
+            self._save()
+            return lesson
@@ -0,0 +1,102 @@
+"""
+lesson_store.py
+
+Offline copy of the dialogs served by `/api/get-json-dialogs`.
+
+The device starts from this SQLite file and syncs it in the background. The
+payload is kept as a skeleton in which every book section is replaced by its
+version, and the sections themselves are stored once per version, so a sync
+only downloads the sections that changed (see `sync.py` on the server).
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+
+
+class LessonStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            db.execute("CREATE TABLE IF NOT EXISTS sections (version TEXT PRIMARY KEY, content TEXT NOT NULL)")
+
+    @contextmanager
+    def _connect(self):
+        # One connection per call: the store is used from the main thread and from boot tasks.
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _get_meta(self, db, key):
+        row = db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @property
+    def etag(self):
+        with self._lock, self._connect() as db:
+            return self._get_meta(db, "etag")
+
+    def section_versions(self):
+        with self._lock, self._connect() as db:
+            return [version for (version,) in db.execute("SELECT version FROM sections")]
+
+    def load(self):
+        """Returns the stored payload, or None if nothing has been synced yet."""
+        with self._lock, self._connect() as db:
+            skeleton = self._get_meta(db, "skeleton")
+            if skeleton is None:
+                return None
+            sections = dict(db.execute("SELECT version, content FROM sections"))
+        data = json.loads(skeleton)
+        for sections_list in _section_lists(data):
+            sections_list[:] = [json.loads(sections[version]) for version in sections_list if version in sections]
+        return data
+
+    def apply(self, data, etag=None):
+        """
+        Stores a payload received from the server. Stub sections are resolved
+        from the local copy; raises ValueError if one is missing, so a broken
+        sync never replaces a good copy. Returns the complete payload.
+        """
+        with self._lock, self._connect() as db:
+            stored = dict(db.execute("SELECT version, content FROM sections"))
+            received = {}
+            skeleton = json.loads(json.dumps(data))
+            for sections_list in _section_lists(skeleton):
+                versions = []
+                for section in sections_list:
+                    # Servers without version stamps: fall back to a local content hash.
+                    version = section.get("version") or hashlib.sha1(
+                        json.dumps(section, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+                    if section.get("unchanged"):
+                        if version not in stored:
+                            raise ValueError(f"Server skipped section {version}, which is not stored locally")
+                    else:
+                        received[version] = json.dumps(section)
+                    versions.append(version)
+                sections_list[:] = versions
+            referenced = {version for sections_list in _section_lists(skeleton) for version in sections_list}
+            db.executemany("INSERT OR REPLACE INTO sections (version, content) VALUES (?, ?)", received.items())
+            db.executemany("DELETE FROM sections WHERE version = ?",
+                           [(version,) for version in stored if version not in referenced])
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('skeleton', ?)", (json.dumps(skeleton),))
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('etag', ?)", (etag,))
+        print(f"[Sync] Stored {len(received)} new sections, reused {len(referenced - set(received))}")
+        return self.load()
+
+
+def _section_lists(data):
+    """Yields the `sections` list of every book in a payload, in place."""
+    for item in (data or {}).get("dialogs") or []:
+        dialogs = (item.get("pdf_book") or {}).get("dialogs")
+        if isinstance(dialogs, dict) and isinstance(dialogs.get("sections"), list):
+            yield dialogs["sections"]
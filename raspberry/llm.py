@@ -0,0 +1,168 @@
+"""
+llm.py
+
+Session-scoped client for the local Ollama server.
+
+One `OllamaSession` lives for the whole device session: it keeps a pooled
+`requests.Session` (no TCP/HTTP setup per call), sends `keep_alive` so the
+model stays resident, and puts the lesson's fixed instructions in the system
+message of `/api/chat`. Because every call starts with the same system
+prefix, Ollama reuses its cached KV state for it and only prefills the user
+turn, which carries the per-question textbook context and instruction. Prefill
+and decode times reported by Ollama are logged for every call.
+
+Every call names a generation profile from `PROFILES`, which caps the number
+of generated tokens, sets the temperature and stop sequences and, for replies
+that must be JSON, passes a JSON schema as Ollama's `format`. Latencies are
+aggregated per profile and printed by `summary()` so the caps can be tuned.
+"""
+
+import json
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+# The 1B model sometimes carries on by inventing the child's next line.
+STOP_TURNS = ["\nStudent:", "\nStudent answer:", "\nChild:", "\nQuestion:"]
+
+LESSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "level": {"type": "string"},
+        "conversations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "prompt": {"type": "string"},
+                    "expected_responses": {"type": "array", "items": {"type": "string"}},
+                    "follow_up": {"type": "string"},
+                },
+                "required": ["prompt", "expected_responses", "follow_up"],
+            },
+        },
+    },
+    "required": ["title", "level", "conversations"],
+}
+
+PROFILES = {
+    # JSON verdict line plus a short hint or feedback (see stream_verdict_and_sentences).
+    "evaluate": {"num_predict": 160, "temperature": 0.2, "stop": STOP_TURNS},
+    "explain": {"num_predict": 140, "temperature": 0.7, "stop": STOP_TURNS},
+    "hint": {"num_predict": 90, "temperature": 0.5, "stop": STOP_TURNS},
+    "feedback": {"num_predict": 160, "temperature": 0.7, "stop": STOP_TURNS},
+    "lesson": {"num_predict": 1024, "temperature": 0.7, "format": LESSON_SCHEMA},
+}
+
+
+class OllamaSession:
+    def __init__(self, model, base_url="http://localhost:11434", keep_alive="30m", pool_size=4, timeout=120):
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+        self.http.headers["Content-Type"] = "application/json"
+        self.last_stats = None
+        # profile -> list of per-call stats
+        self.stats = {}
+
+    def _payload(self, prompt, system, stream, profile=None):
+        messages = []
+        if system:
+            messages.append({"role": "system", "content": system})
+        messages.append({"role": "user", "content": prompt})
+        data = {
+            "model": self.model,
+            "messages": messages,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+        }
+        if profile:
+            settings = dict(PROFILES[profile])
+            if "format" in settings:
+                data["format"] = settings.pop("format")
+            data["options"] = settings
+        return data
+
+    def preload(self):
+        """Loads the model into memory without generating anything."""
+        response = self.http.post(f"{self.base_url}/api/chat",
+                                  data=json.dumps({"model": self.model, "messages": [], "keep_alive": self.keep_alive}),
+                                  timeout=self.timeout)
+        response.raise_for_status()
+
+    def chat(self, prompt, system=None, profile=None):
+        """Returns the complete reply to `prompt`, generated with the named profile."""
+        started = time.perf_counter()
+        response = self.http.post(f"{self.base_url}/api/chat",
+                                  data=json.dumps(self._payload(prompt, system, False, profile)),
+                                  timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        self._record(profile, data, time.perf_counter() - started)
+        return data["message"]["content"]
+
+    def stream(self, prompt, system=None, profile=None, stop=None):
+        """
+        Yields reply fragments as Ollama generates them, with the named profile.
+        Setting the `stop` event closes the connection, which makes Ollama abort
+        the generation instead of decoding up to `num_predict` for nobody.
+        """
+        started = time.perf_counter()
+        first = None
+        with self.http.post(f"{self.base_url}/api/chat",
+                            data=json.dumps(self._payload(prompt, system, True, profile)),
+                            stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if stop is not None and stop.is_set():
+                    print(f"[LLM] {profile or 'default'}: cancelled after {time.perf_counter() - started:.2f}s")
+                    return
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                content = chunk.get("message", {}).get("content")
+                if content:
+                    if first is None:
+                        first = time.perf_counter() - started
+                    yield content
+                if chunk.get("done"):
+                    self._record(profile, chunk, time.perf_counter() - started, first)
+                    break
+
+    def _record(self, profile, data, elapsed, first_token=None):
+        # Ollama reports durations in nanoseconds.
+        label = profile or "default"
+        stats = {
+            "profile": label,
+            "load": data.get("load_duration", 0) / 1e9,
+            "prefill_tokens": data.get("prompt_eval_count", 0),
+            "prefill": data.get("prompt_eval_duration", 0) / 1e9,
+            "decode_tokens": data.get("eval_count", 0),
+            "decode": data.get("eval_duration", 0) / 1e9,
+            "first_token": first_token,
+            "total": elapsed,
+        }
+        self.last_stats = stats
+        self.stats.setdefault(label, []).append(stats)
+        first = f", first token {first_token:.2f}s" if first_token is not None else ""
+        print(f"[LLM] {label}: prefill {stats['prefill_tokens']} tok in {stats['prefill']:.2f}s, "
+              f"decode {stats['decode_tokens']} tok in {stats['decode']:.2f}s, "
+              f"load {stats['load']:.2f}s{first}, total {elapsed:.2f}s")
+
+    def summary(self):
+        """Prints mean latency and token counts per profile for this session."""
+        for label, calls in sorted(self.stats.items()):
+            count = len(calls)
+            mean = lambda key: sum(call[key] for call in calls) / count
+            print(f"[LLM] {label}: {count} calls, mean total {mean('total'):.2f}s, "
+                  f"prefill {mean('prefill'):.2f}s ({mean('prefill_tokens'):.0f} tok), "
+                  f"decode {mean('decode'):.2f}s ({mean('decode_tokens'):.0f} tok)")
+
+    def close(self):
+        self.http.close()
@@ -0,0 +1,161 @@
+"""
+phrase_cache.py
+
+On-disk cache of rendered Piper audio for fixed and recurring phrases.
+
+Entries are raw int16 mono PCM files keyed by (voice model, text). The cache is
+bounded in bytes and evicts the least recently used entries; phrases warmed at
+boot are also kept in memory so they play with no disk access and no Piper CPU.
+Audio bundles rendered on the server can be attached and are looked up after
+the local entries, straight from the memory-mapped bundle file.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from .synthesis import render
+from .audio_bundle import phrase_key
+
+
+class PhraseCache:
+    def __init__(self, cache_dir, voice_id, max_bytes=200 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.voice_id = voice_id
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._memory = {}
+        # key -> size in bytes, least recently used first
+        self._index = OrderedDict()
+        self._bundles = []
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".pcm"):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, name))
+            entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+
+    def key(self, text):
+        # Same key as the server-rendered bundles, so both lookups agree.
+        return phrase_key(self.voice_id, text)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pcm")
+
+    def __contains__(self, text):
+        key = self.key(text)
+        with self._lock:
+            if key in self._index:
+                return True
+        return self._from_bundles(key) is not None
+
+    def attach_bundle(self, bundle):
+        """Adds a server-rendered `AudioBundle`; ignored if it was rendered with another voice."""
+        if bundle.voice_id != self.voice_id:
+            print(f"[TTS cache] Ignoring audio bundle for voice {bundle.voice_id}")
+            return False
+        with self._lock:
+            self._bundles.append(bundle)
+        print(f"[TTS cache] Attached audio bundle with {len(bundle)} phrases")
+        return True
+
+    def _from_bundles(self, key):
+        with self._lock:
+            bundles = list(self._bundles)
+        for bundle in bundles:
+            samples = bundle.get(key)
+            if samples is not None:
+                return samples
+        return None
+
+    def get(self, text):
+        """Returns the cached samples for `text`, or None."""
+        key = self.key(text)
+        with self._lock:
+            samples = self._memory.get(key)
+            cached = key in self._index
+            if cached:
+                self._index.move_to_end(key)
+        if not cached:
+            return self._from_bundles(key)
+        if samples is not None:
+            return samples
+        path = self._path(key)
+        try:
+            samples = np.fromfile(path, dtype=np.int16)
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._index.pop(key, None)
+            return self._from_bundles(key)
+        return samples
+
+    def put(self, text, samples):
+        key = self.key(text)
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        samples = np.asarray(samples, dtype=np.int16)
+        samples.tofile(tmp_path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._index[key] = samples.nbytes
+            self._index.move_to_end(key)
+            if key in self._memory:
+                self._memory[key] = samples
+            self._evict()
+
+    def _evict(self):
+        total = sum(self._index.values())
+        while total > self.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            self._memory.pop(key, None)
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            total -= size
+
+    def render(self, voice, text):
+        samples = render(voice, text)
+        self.put(text, samples)
+        return samples
+
+    def warm_up(self, voice, texts):
+        """Renders any missing phrase and pins all of them in memory."""
+        started = time.time()
+        rendered = 0
+        for text in texts:
+            samples = self.get(text)
+            if samples is None:
+                samples = self.render(voice, text)
+                rendered += 1
+            with self._lock:
+                self._memory[self.key(text)] = samples
+        print(f"[TTS cache] Warmed {len(texts)} phrases ({rendered} rendered) in {time.time() - started:.2f}s")
+
+    def prerender_in_background(self, voice, texts, is_idle=lambda: True):
+        """
+        Renders missing phrases on a daemon thread, only while `is_idle()` is true
+        so it never competes with live synthesis for the CPU.
+        """
+        def run():
+            for text in texts:
+                if text in self:
+                    continue
+                while not is_idle():
+                    time.sleep(0.2)
+                try:
+                    self.render(voice, text)
+                except Exception as e:
+                    print(f"[TTS cache] Failed to pre-render phrase: {e}")
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,134 @@
+"""
+playback.py
+
+Long-lived audio output for the Raspberry Pi assistant.
+
+A single `sounddevice` output stream stays open for the whole session and pulls
+samples from a ring buffer in its callback. A synthesis thread runs Piper and
+writes each raw chunk straight into the ring, so synthesis of the next sentence
+overlaps playback of the current one and no device is opened per utterance.
+"""
+
+import time
+import queue
+import threading
+import numpy as np
+import sounddevice as sd
+from .synthesis import synthesize_raw
+
+
+class PlaybackEngine:
+    def __init__(self, voice, buffer_seconds=30, blocksize=512):
+        self.voice = voice
+        self.sample_rate = voice.config.sample_rate
+        self._capacity = int(self.sample_rate * buffer_seconds)
+        self._ring = np.zeros(self._capacity, dtype=np.int16)
+        # Monotonic sample counters; ring position is counter % capacity.
+        self._written = 0
+        self._played = 0
+        self._cond = threading.Condition()
+        self._jobs = queue.Queue()
+        self._closed = False
+
+        self.stream = sd.OutputStream(
+            samplerate=self.sample_rate,
+            channels=1,
+            dtype='int16',
+            blocksize=blocksize,
+            latency='low',
+            callback=self._callback
+        )
+        self.stream.start()
+
+        self._worker = threading.Thread(target=self._synthesize_loop, daemon=True)
+        self._worker.start()
+
+    def say(self, text, on_rendered=None):
+        """
+        Queues text for synthesis and returns immediately. `on_rendered`, if given,
+        receives the complete samples once synthesis has finished.
+        """
+        self._jobs.put((text, on_rendered))
+
+    def play(self, samples):
+        """Queues already rendered int16 mono samples at the voice's sample rate."""
+        self._jobs.put(np.asarray(samples, dtype=np.int16))
+
+    def speak(self, text):
+        """Speaks text and blocks until it has been played."""
+        self.say(text)
+        self.wait()
+
+    def wait(self):
+        """Blocks until every queued job has been synthesized and played out."""
+        self._jobs.join()
+        with self._cond:
+            while self._written > self._played and not self._closed:
+                self._cond.wait(timeout=0.1)
+        # Let the device drain its own (low-latency) buffer before the mic opens.
+        time.sleep(self.stream.latency)
+
+    @property
+    def busy(self):
+        with self._cond:
+            return self._jobs.unfinished_tasks > 0 or self._written > self._played
+
+    def close(self):
+        self._closed = True
+        with self._cond:
+            self._cond.notify_all()
+        self.stream.stop()
+        self.stream.close()
+
+    def _synthesize_loop(self):
+        while not self._closed:
+            job = self._jobs.get()
+            try:
+                if isinstance(job, tuple):
+                    text, on_rendered = job
+                    chunks = []
+                    for audio_bytes in synthesize_raw(self.voice, text):
+                        # A view over Piper's bytes; the only copy is into the ring.
+                        self._write(np.frombuffer(audio_bytes, dtype=np.int16))
+                        if on_rendered:
+                            chunks.append(audio_bytes)
+                    if on_rendered:
+                        on_rendered(np.frombuffer(b"".join(chunks), dtype=np.int16))
+                else:
+                    self._write(job)
+            except Exception as e:
+                print(f"[TTS] Synthesis failed: {e}")
+            finally:
+                self._jobs.task_done()
+
+    def _write(self, samples):
+        offset = 0
+        total = len(samples)
+        while offset < total:
+            with self._cond:
+                while self._written - self._played >= self._capacity and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                free = self._capacity - (self._written - self._played)
+                count = min(total - offset, free)
+                start = self._written % self._capacity
+                first = min(count, self._capacity - start)
+                self._ring[start:start + first] = samples[offset:offset + first]
+                if count > first:
+                    self._ring[:count - first] = samples[offset + first:offset + count]
+                self._written += count
+            offset += count
+
+    def _callback(self, outdata, frames, time_info, status):
+        out = outdata[:, 0]
+        with self._cond:
+            count = min(frames, self._written - self._played)
+            start = self._played % self._capacity
+            first = min(count, self._capacity - start)
+            out[:first] = self._ring[start:start + first]
+            if count > first:
+                out[first:count] = self._ring[:count - first]
+            self._played += count
+            self._cond.notify_all()
+        out[count:] = 0
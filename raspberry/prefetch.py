@@ -0,0 +1,67 @@
+"""
+prefetch.py
+
+Speculative generation of the next thing the assistant will say.
+
+`Prefetch` consumes a sentence generator (usually `stream_sentences`) on a
+daemon thread while the child is answering the current question, optionally
+rendering each sentence with Piper as well. Iterating it later yields
+(sentence, samples) pairs: sentences produced so far come out immediately and
+the rest as they arrive. `cancel()` drops the work if it is never needed and
+calls `on_cancel`, which should stop the generation feeding it.
+"""
+
+import time
+import queue
+import threading
+
+
+class Prefetch:
+    def __init__(self, sentences, render=None, name="prefetch", on_cancel=None):
+        self.name = name
+        self._on_cancel = on_cancel
+        self._sentences = sentences
+        self._render = render
+        self._items = queue.Queue()
+        self._done = object()
+        self._cancelled = threading.Event()
+        self._started = time.perf_counter()
+        self.ready_after = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def ready(self):
+        return self.ready_after is not None
+
+    def cancel(self):
+        self._cancelled.set()
+        if self._on_cancel is not None:
+            self._on_cancel()
+
+    def _run(self):
+        try:
+            for sentence in self._sentences:
+                if self._cancelled.is_set():
+                    return
+                samples = None
+                if self._render is not None:
+                    try:
+                        samples = self._render(sentence)
+                    except Exception as e:
+                        print(f"[Prefetch] Rendering failed, will synthesize live: {e}")
+                self._items.put((sentence, samples))
+        except Exception as e:
+            print(f"[Prefetch] {self.name} failed: {e}")
+        finally:
+            self.ready_after = time.perf_counter() - self._started
+            self._items.put(self._done)
+
+    def __iter__(self):
+        print(f"[Prefetch] {self.name} " + (f"was ready after {self.ready_after:.2f}s" if self.ready
+                                              else "still generating, continuing live"))
+        while True:
+            item = self._items.get()
+            if item is self._done:
+                return
+            yield item
@@ -0,0 +1,51 @@
+"""
+resample.py
+
+NumPy-only polyphase resampler, used when the microphone cannot capture at
+16 kHz natively. Replaces torchaudio so the device runtime does not need torch.
+
+The anti-aliasing filter is a Kaiser-windowed sinc designed once per rate
+pair and split into `up` phases; each output sample is a dot product of one
+phase with the input samples it overlaps.
+"""
+
+from math import gcd
+import numpy as np
+
+
+class PolyphaseResampler:
+    def __init__(self, orig_rate, new_rate, taps_per_phase=16, beta=8.0, block=8192):
+        divisor = gcd(orig_rate, new_rate)
+        self.up = new_rate // divisor
+        self.down = orig_rate // divisor
+        self.block = block
+
+        # Filter length scales with the larger factor so decimation is filtered as well.
+        taps_per_phase = -(-taps_per_phase * max(self.up, self.down) // self.up)
+        num_taps = taps_per_phase * self.up
+        cutoff = 1.0 / max(self.up, self.down)
+        t = np.arange(num_taps) - (num_taps - 1) / 2
+        h = cutoff * np.sinc(cutoff * t) * np.kaiser(num_taps, beta) * self.up
+        # phases[p, j] = h[p + j * up], the taps applied for upsampled phase p
+        self.phases = h.reshape(taps_per_phase, self.up).T.astype(np.float32)
+        self.taps = taps_per_phase
+        self.delay = (num_taps - 1) // 2
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        n_out = (len(x) * self.up) // self.down
+        if n_out == 0:
+            return np.zeros(0, dtype=np.float32)
+        padded = np.concatenate((
+            np.zeros(self.taps, dtype=np.float32), x, np.zeros(self.taps, dtype=np.float32)))
+        out = np.empty(n_out, dtype=np.float32)
+        offsets = np.arange(self.taps)
+        for start in range(0, n_out, self.block):
+            n = np.arange(start, min(start + self.block, n_out))
+            # Position in the upsampled signal, shifted by the filter's group delay.
+            m = n * self.down + self.delay
+            phase = m % self.up
+            base = m // self.up + self.taps
+            window = padded[np.clip(base[:, None] - offsets[None, :], 0, len(padded) - 1)]
+            out[start:start + len(n)] = np.einsum("nt,nt->n", self.phases[phase], window)
+        return out
@@ -0,0 +1,92 @@
+"""
+retrieval.py
+
+BM25 retrieval over the paragraphs and vocabulary of one book section.
+
+The index is built once at ingestion (`build_index`) and shipped with the
+section as plain JSON: the passages and, per passage, its term counts. The
+device turns it into a dense NumPy weight matrix (`Retriever`), so a query is a
+column gather and a row sum, and only the top-k passages go into the prompt
+instead of the whole section.
+"""
+
+import numpy as np
+from .answer_match import content_words
+
+FORMAT_VERSION = 1
+
+
+def tokenize(text):
+    # Crude plural folding is enough for children's textbook text.
+    return [word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+            for word in content_words(text)]
+
+
+def build_index(passages, k1=1.2, b=0.75):
+    """Returns the JSON-serializable index of `passages` (a list of strings)."""
+    passages = [passage.strip() for passage in passages if passage and passage.strip()]
+    terms = {}
+    counts = []
+    for passage in passages:
+        tf = {}
+        for word in tokenize(passage):
+            term = terms.setdefault(word, len(terms))
+            tf[term] = tf.get(term, 0) + 1
+        counts.append(sorted(tf.items()))
+    return {
+        "format": FORMAT_VERSION,
+        "k1": k1,
+        "b": b,
+        "passages": passages,
+        "terms": list(terms),
+        "tf": counts,
+    }
+
+
+class Retriever:
+    def __init__(self, index):
+        if index.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported retrieval index format {index.get('format')}")
+        self.passages = index["passages"]
+        self._terms = {term: i for i, term in enumerate(index["terms"])}
+        tf = np.zeros((len(self.passages), len(self._terms)), dtype=np.float32)
+        for row, counts in enumerate(index["tf"]):
+            for term, count in counts:
+                tf[row, term] = count
+        k1, b = index["k1"], index["b"]
+        lengths = tf.sum(axis=1, keepdims=True)
+        norm = k1 * (1 - b + b * lengths / max(float(lengths.mean()), 1.0)) if len(self.passages) else lengths
+        df = (tf > 0).sum(axis=0)
+        idf = np.log1p((len(self.passages) - df + 0.5) / (df + 0.5)).astype(np.float32)
+        self._weights = idf * tf * (k1 + 1) / (tf + norm)
+
+    def search(self, query, k=3):
+        """Returns up to `k` (score, passage index) pairs, best first; passages sharing no term are left out."""
+        columns = sorted({self._terms[word] for word in tokenize(query) if word in self._terms})
+        if not columns:
+            return []
+        scores = self._weights[:, columns].sum(axis=1)
+        best = np.argsort(-scores, kind="stable")[:k]
+        return [(float(scores[i]), int(i)) for i in best if scores[i] > 0]
+
+    def context(self, query, k=3, fallback="", max_chars=None):
+        """
+        The top-k passages for `query` in textbook order, or `fallback` if none
+        match. With `max_chars`, lower-ranked passages that would not fit are
+        left out whole; the best passage is cut if it alone is too long.
+        """
+        hits = self.search(query, k)
+        if not hits:
+            return fallback if max_chars is None else fallback[:max_chars]
+        chosen = []
+        used = 0
+        for _, i in hits:
+            length = len(self.passages[i]) + (2 if chosen else 0)
+            if max_chars is not None and used + length > max_chars:
+                continue
+            chosen.append(i)
+            used += length
+        if not chosen:
+            return self.passages[hits[0][1]][:max_chars]
+        return "\n\n".join(self.passages[i] for i in sorted(chosen))
+
@@ -0,0 +1,128 @@
+"""
+student_profile.py
+
+Bounded memory of the child for chat mode.
+
+Only the last few responses are kept verbatim; older ones are folded into a
+compact summary (turn count, typical answer length, most used words), and
+interests are capped, so the text injected into prompts stays under a fixed
+token budget however long the session runs. The compact part is saved as JSON
+and loaded again at the start of the next session.
+"""
+
+import os
+import re
+import json
+from collections import Counter, deque
+from .asr import STOPWORDS
+
+# Rough size of an English token for the 1B model's tokenizer.
+CHARS_PER_TOKEN = 4
+
+
+def _as_list(interests):
+    # The evaluator (and older saved profiles) sometimes give a single interest as a string.
+    if not interests:
+        return []
+    return [interests] if isinstance(interests, str) else list(interests)
+
+
+class StudentProfile:
+    def __init__(self, language_level="beginner", interests=None, feedback_focus="vocabulary", turns=0,
+                 total_words=0, vocabulary=None, window=4, max_interests=6, max_vocabulary=12, max_tokens=120):
+        self.language_level = language_level
+        self.interests = _as_list(interests)[-max_interests:]
+        self.feedback_focus = feedback_focus
+        self.turns = turns
+        self.total_words = total_words
+        self.vocabulary = Counter(vocabulary or {})
+        self.recent = deque(maxlen=window)
+        self.max_interests = max_interests
+        self.max_vocabulary = max_vocabulary
+        self.max_tokens = max_tokens
+
+    def add_response(self, text):
+        if len(self.recent) == self.recent.maxlen:
+            self._fold(self.recent[0])
+        self.recent.append(text)
+        self.turns += 1
+
+    def _fold(self, text):
+        words = re.findall(r"[a-z']+", text.lower())
+        self.total_words += len(words)
+        self.vocabulary.update(word for word in words if word not in STOPWORDS and len(word) > 2)
+        # Keep the counter itself bounded, not just what is shown.
+        if len(self.vocabulary) > 4 * self.max_vocabulary:
+            self.vocabulary = Counter(dict(self.vocabulary.most_common(2 * self.max_vocabulary)))
+
+    def update(self, evaluation):
+        """Merges the language level, interests and focus inferred by the evaluator."""
+        self.language_level = evaluation.get("language_level") or self.language_level
+        self.feedback_focus = evaluation.get("feedback_focus") or self.feedback_focus
+        for interest in _as_list(evaluation.get("interests")):
+            if interest in self.interests:
+                self.interests.remove(interest)
+            self.interests.append(interest)
+        self.interests = self.interests[-self.max_interests:]
+
+    def summary(self):
+        folded = self.turns - len(self.recent)
+        if folded <= 0:
+            return ""
+        words = ", ".join(word for word, _ in self.vocabulary.most_common(self.max_vocabulary))
+        return (f"{folded} earlier answers averaging {self.total_words / folded:.0f} words"
+                + (f"; words used: {words}" if words else ""))
+
+    def prompt_text(self):
+        """The profile as prompt text, cut to at most `max_tokens` (approximate)."""
+        parts = [
+            f"level: {self.language_level}",
+            f"focus: {self.feedback_focus}",
+            f"interests: {', '.join(self.interests) or 'unknown'}",
+        ]
+        summary = self.summary()
+        if summary:
+            parts.append(f"history: {summary}")
+        limit = self.max_tokens * CHARS_PER_TOKEN
+        recent = list(self.recent)
+        # Drop the oldest verbatim answers first, then cut whatever is still too long.
+        while recent:
+            text = "; ".join(parts + ["recent answers: " + " | ".join(recent)])
+            if len(text) <= limit:
+                return text
+            recent.pop(0)
+        text = "; ".join(parts)
+        if len(text) > limit:
+            text = text[:limit].rsplit(" ", 1)[0] + " ..."
+        return text
+
+    def to_dict(self):
+        # Recent answers are folded in so the next session starts from the summary only.
+        for text in self.recent:
+            self._fold(text)
+        self.recent.clear()
+        return {
+            "language_level": self.language_level,
+            "interests": self.interests,
+            "feedback_focus": self.feedback_focus,
+            "turns": self.turns,
+            "total_words": self.total_words,
+            "vocabulary": dict(self.vocabulary.most_common(2 * self.max_vocabulary)),
+        }
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, **defaults):
+        """Loads a saved profile, or returns a new one built from `defaults`."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return cls(**defaults)
+        return cls(**{**defaults, **saved})
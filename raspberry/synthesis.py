@@ -0,0 +1,32 @@
+"""
+synthesis.py
+
+Serialized access to the shared Piper voice.
+
+One `PiperVoice` (one ONNX session) is used by the playback worker, the phrase
+cache and the prefetch thread, and it is not safe to run concurrently. Every
+synthesis goes through `synthesize_raw`, which holds a single lock for each
+chunk Piper produces, so callers take turns sentence by sentence and live
+playback never waits for a whole background render.
+"""
+
+import threading
+import numpy as np
+
+_lock = threading.Lock()
+
+
+def synthesize_raw(voice, text):
+    """Yields Piper's raw int16 chunks for `text`, one locked step at a time."""
+    chunks = voice.synthesize_stream_raw(text)
+    while True:
+        with _lock:
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def render(voice, text):
+    """Synthesizes `text` completely and returns int16 mono samples."""
+    return np.frombuffer(b"".join(synthesize_raw(voice, text)), dtype=np.int16)
@@ -0,0 +1,154 @@
+"""
+vad.py
+
+Voice activity detection for the capture engine.
+
+A detector is any object with `reset()`, `process(frame)` returning None,
+"speech_start" or "speech_end", and a `lookback_samples` attribute telling the
+caller how far before the current frame the utterance really started (pre-roll
+plus detection delay). `EnergyVAD` calibrates on the room's noise floor, keeps
+adapting it between utterances and ends an utterance after a short hangover
+instead of a fixed two seconds of silence.
+
+Run `python -m raspberry.vad fixtures/*.wav` to benchmark a detector on WAV
+recordings; a sidecar `<name>.json` with {"speech_end": seconds} enables the
+end-of-speech latency column.
+"""
+
+import os
+import sys
+import json
+import wave
+import numpy as np
+
+
+class EnergyVAD:
+    def __init__(self, sample_rate, frame_size, hangover_ms=450, pre_roll_ms=300, min_speech_ms=90,
+                 calibration_ms=200, threshold_db=9.0, release_db=6.0, min_rms=0.002, noise_adapt=0.05):
+        self.sample_rate = sample_rate
+        self.frame_size = frame_size
+        frame_ms = 1000 * frame_size / sample_rate
+        self.hangover_frames = max(1, int(round(hangover_ms / frame_ms)))
+        self.min_speech_frames = max(1, int(round(min_speech_ms / frame_ms)))
+        self.calibration_frames = max(1, int(round(calibration_ms / frame_ms)))
+        self.pre_roll_samples = int(pre_roll_ms * sample_rate / 1000)
+        self.start_ratio = 10 ** (threshold_db / 20)
+        self.release_ratio = 10 ** (release_db / 20)
+        self.min_rms = min_rms
+        self.noise_adapt = noise_adapt
+        # The noise floor survives reset() so later turns start already calibrated.
+        self.noise_rms = None
+        self.reset()
+
+    @property
+    def lookback_samples(self):
+        return self.pre_roll_samples + self.min_speech_frames * self.frame_size
+
+    @property
+    def threshold(self):
+        return max(self.min_rms, (self.noise_rms or 0.0) * self.start_ratio)
+
+    def reset(self):
+        self.in_speech = False
+        self._frames = 0
+        self._speech_frames = 0
+        self._silence_frames = 0
+        self._calibration = []
+
+    def process(self, frame):
+        rms = float(np.sqrt(np.dot(frame, frame) / len(frame)))
+        self._frames += 1
+
+        if self.noise_rms is None:
+            self._calibration.append(rms)
+            if len(self._calibration) < self.calibration_frames:
+                return None
+            # The quietest calibration frames are the best guess for the room,
+            # even if the child starts talking during calibration.
+            self.noise_rms = float(np.percentile(self._calibration, 25))
+
+        if not self.in_speech:
+            if rms > self.threshold:
+                self._speech_frames += 1
+                if self._speech_frames >= self.min_speech_frames:
+                    self.in_speech = True
+                    self._silence_frames = 0
+                    return "speech_start"
+            else:
+                self._speech_frames = 0
+                self.noise_rms += self.noise_adapt * (rms - self.noise_rms)
+            return None
+
+        release = max(self.min_rms, self.noise_rms * self.release_ratio)
+        if rms > release:
+            self._silence_frames = 0
+            return None
+        self._silence_frames += 1
+        if self._silence_frames >= self.hangover_frames:
+            self.in_speech = False
+            self._speech_frames = 0
+            return "speech_end"
+        return None
+
+
+def read_wav(path):
+    """Reads a 16-bit WAV file as float32 mono."""
+    with wave.open(path, "rb") as wav:
+        sample_rate = wav.getframerate()
+        channels = wav.getnchannels()
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+    if channels > 1:
+        samples = samples[::channels]
+    return samples.astype(np.float32) / 32768, sample_rate
+
+
+def benchmark(paths, make_vad=EnergyVAD, frame_size=512):
+    """
+    Feeds each WAV through a fresh detector frame by frame and reports when
+    speech started/ended, the end-of-speech latency against the labelled end,
+    and processing cost per second of audio.
+    """
+    import time
+
+    results = []
+    for path in paths:
+        audio, sample_rate = read_wav(path)
+        vad = make_vad(sample_rate, frame_size)
+        start = end = None
+        started = time.perf_counter()
+        for offset in range(0, len(audio) - frame_size + 1, frame_size):
+            event = vad.process(audio[offset:offset + frame_size])
+            if event == "speech_start" and start is None:
+                start = max(0, offset + frame_size - vad.lookback_samples) / sample_rate
+            elif event == "speech_end" and start is not None:
+                end = (offset + frame_size) / sample_rate
+                break
+        cost = time.perf_counter() - started
+
+        label_path = os.path.splitext(path)[0] + ".json"
+        labelled_end = None
+        if os.path.exists(label_path):
+            with open(label_path, "r", encoding="utf-8") as f:
+                labelled_end = json.load(f).get("speech_end")
+
+        results.append({
+            "file": os.path.basename(path),
+            "speech_start": start,
+            "speech_end": end,
+            "end_latency": (end - labelled_end) if end is not None and labelled_end is not None else None,
+            "cost_per_audio_second": cost / (len(audio) / sample_rate),
+        })
+    return results
+
+
+def _fmt(value, unit="s"):
+    return "-" if value is None else f"{value:.3f}{unit}"
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m raspberry.vad fixture.wav [fixture.wav ...]")
+        sys.exit(1)
+    for result in benchmark(sys.argv[1:]):
+        print(f"{result['file']:<32} start {_fmt(result['speech_start'])}  end {_fmt(result['speech_end'])}  "
+              f"latency {_fmt(result['end_latency'])}  cost {result['cost_per_audio_second'] * 1000:.2f} ms/s")
@@ -76,12 +76,35 @@ class PDFBook(PDFBookBase):
     filename: str
     user_id: int
     json_content: Optional[Dict[str, Any]] = None
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    cost_usd: Optional[float] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
+class StageUsage(BaseModel):
+    calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    images: int = 0
+    retries: int = 0
+    latency_seconds: float = 0.0
+    cost_usd: float = 0.0
+
+class UsageReport(BaseModel):
+    stages: Dict[str, StageUsage] = {}
+    totals: StageUsage = StageUsage()
+
+class PDFBookUsage(UsageReport):
+    pdf_id: int
+
+class UserUsage(UsageReport):
+    user_id: int
+    books: int
+
 class Prompt(PromptBase):
     id: int
     user_id: int
@@ -0,0 +1,74 @@
+"""
+startup_budget.py
+
+Checks the cold-start cost of the API process. Imports `main` in a fresh
+interpreter and exits with code 1 when the import takes longer than the budget
+or pulls in the PDF ingestion stack, which must only load inside the worker.
+
+Usage: python startup_budget.py [budget_seconds]
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+IMPORT_BUDGET_SECONDS = float(os.getenv("API_IMPORT_BUDGET_SECONDS", "1.5"))
+RUNS = 3
+
+FORBIDDEN_MODULES = [
+    "pdf2json.gpt",
+    "pdf2json.util",
+    "pdf2json.book2dial",
+    "pdf2json.tts",
+    "piper",
+    "PIL",
+    "pypdfium2",
+    "split_image",
+    "openai",
+]
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+print(json.dumps({"seconds": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def measure_import():
+    env = dict(os.environ)
+    # create_engine does not connect, so any URL works for an import probe.
+    env.setdefault("DATABASE_URL", "postgresql://localhost/startup_budget")
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(budget=IMPORT_BUDGET_SECONDS):
+    samples = [measure_import() for _ in range(RUNS)]
+    best = min(sample["seconds"] for sample in samples)
+    loaded = set(samples[0]["modules"])
+    leaked = [name for name in FORBIDDEN_MODULES if name in loaded]
+
+    print(f"[Startup] import main: best of {RUNS} = {best:.3f}s (budget {budget:.3f}s)")
+    ok = True
+    if leaked:
+        print(f"[Startup] Ingestion modules loaded at API import: {', '.join(leaked)}")
+        ok = False
+    if best > budget:
+        print(f"[Startup] Import time over budget by {best - budget:.3f}s")
+        ok = False
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else IMPORT_BUDGET_SECONDS
+    sys.exit(main(budget))
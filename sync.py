@@ -0,0 +1,52 @@
+"""
+Version stamps for the device lesson sync.
+
+Every section of a book's dialogs gets a content hash as its version, and the
+whole `/api/get-json-dialogs` payload gets one as its ETag. A device sends the
+ETag of its local copy (`If-None-Match`) and the section versions it already
+stores (`have`); unchanged payloads answer 304 and sections the device already
+has are sent as `{"version": ..., "unchanged": true}` stubs, so only changed
+sections travel.
+"""
+
+import json
+import hashlib
+
+
+def content_version(value):
+    """Stable short hash of a JSON-serializable value."""
+    encoded = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()[:16]
+
+
+def stamp_sections(dialogs):
+    """Returns a copy of a book's dialogs with a `version` on every section."""
+    if not isinstance(dialogs, dict) or not isinstance(dialogs.get("sections"), list):
+        return dialogs
+    sections = []
+    for section in dialogs["sections"]:
+        section = {key: value for key, value in section.items() if key != "version"}
+        sections.append({**section, "version": content_version(section)})
+    return {**dialogs, "sections": sections}
+
+
+def parse_have(have):
+    """Splits the comma-separated `have` query parameter into a set of section versions."""
+    return {version.strip() for version in (have or "").split(",") if version.strip()}
+
+
+def strip_known_sections(items, known):
+    """Replaces sections whose version the device already stores with stubs."""
+    if not known:
+        return items
+    stripped = []
+    for item in items:
+        dialogs = (item.get("pdf_book") or {}).get("dialogs")
+        if isinstance(dialogs, dict) and isinstance(dialogs.get("sections"), list):
+            sections = [
+                {"version": section["version"], "unchanged": True} if section.get("version") in known else section
+                for section in dialogs["sections"]
+            ]
+            item = {**item, "pdf_book": {**item["pdf_book"], "dialogs": {**dialogs, "sections": sections}}}
+        stripped.append(item)
+    return stripped
@@ -0,0 +1,182 @@
+"""
+tracing.py
+
+Minimal span-based tracing for the PDF ingestion pipeline.
+
+Spans nest through a context variable, so a span opened inside another one
+becomes its child without passing anything around. Work handed to a background
+task or thread keeps its trace by passing `current_context()` as the `parent`
+of its first span, or by wrapping the callable with `propagate()`.
+
+Finished spans go to a pluggable exporter selected with the TRACE_EXPORTER
+environment variable:
+    none              (default) spans are tracked but not exported
+    console           one line per span on stdout
+    file:<path>       one JSON object per span appended to <path>
+"""
+
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class SpanContext:
+    def __init__(self, trace_id, span_id):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+
+class Span:
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.error = None
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms = None
+
+    @property
+    def context(self):
+        return SpanContext(self.trace_id, self.span_id)
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes):
+        self.attributes.update(attributes)
+
+    def end(self):
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class NoopExporter:
+    def export(self, span):
+        pass
+
+
+class ConsoleExporter:
+    def export(self, span):
+        attributes = " ".join(f"{k}={v}" for k, v in span.attributes.items())
+        print(f"[Trace] {span.trace_id[:8]} {span.name} {span.duration_ms:.1f} ms {span.status} {attributes}".rstrip())
+
+
+class FileExporter:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def exporter_from_env():
+    setting = os.getenv("TRACE_EXPORTER", "none")
+    if setting == "console":
+        return ConsoleExporter()
+    if setting.startswith("file:"):
+        return FileExporter(setting[len("file:"):])
+    return NoopExporter()
+
+
+_exporter = exporter_from_env()
+
+
+def set_exporter(exporter):
+    global _exporter
+    _exporter = exporter
+
+
+def current_span():
+    return _current_span.get()
+
+
+def current_context():
+    span = _current_span.get()
+    return span.context if span else None
+
+
+@contextmanager
+def start_span(name, parent=None, **attributes):
+    """
+    Opens a span as a child of `parent` (a SpanContext) or, by default, of the
+    span currently active in this context.
+    """
+    if parent is None:
+        parent = current_context()
+    span = Span(name, parent, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except Exception as e:
+        span.status = "error"
+        span.error = str(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+        try:
+            _exporter.export(span)
+        except Exception as export_error:
+            print(f"[Trace] Failed to export span {span.name}: {export_error}")
+
+
+def record_error(error):
+    """Marks the active span as failed when the error is handled instead of raised."""
+    span = _current_span.get()
+    if span:
+        span.status = "error"
+        span.error = str(error)
+
+
+def propagate(fn):
+    """Binds `fn` to a copy of the current context, for use in threads and executors."""
+    ctx = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return ctx.run(fn, *args, **kwargs)
+
+    return run
+
+
+def record_usage(span, usage, model=None):
+    """Copies token counts from an OpenAI `usage` block (dict or object) onto a span."""
+    if model:
+        span.set_attribute("model", model)
+    if not usage:
+        return
+    if not isinstance(usage, dict):
+        usage = {
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None),
+            "total_tokens": getattr(usage, "total_tokens", None),
+        }
+    span.set_attributes({
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "completion_tokens": usage.get("completion_tokens"),
+        "total_tokens": usage.get("total_tokens"),
+    })
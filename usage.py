@@ -0,0 +1,145 @@
+"""
+usage.py
+
+Token, image, latency and cost accounting for the OpenAI calls made while a
+book is ingested.
+
+Every call site reports through `record_call`, which updates the process-wide
+metrics and the ledger of the book currently being processed (opened with
+`track()` around the ingestion). The ledger aggregates per stage and can stop
+the ingestion once a token budget is exceeded.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+import metrics
+
+# USD per 1M tokens as (input, output). Unknown models are counted with zero cost.
+MODEL_PRICES = {
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+# Maximum input + output tokens per book; 0 disables the budget.
+TOKEN_BUDGET = int(os.getenv("INGESTION_TOKEN_BUDGET", "0"))
+
+llm_calls_total = metrics.REGISTRY.counter(
+    "llm_calls_total", "OpenAI calls by pipeline stage and model.", ("stage", "model"))
+llm_tokens_total = metrics.REGISTRY.counter(
+    "llm_tokens_total", "OpenAI tokens by pipeline stage, model and direction.", ("stage", "model", "direction"))
+llm_retries_total = metrics.REGISTRY.counter(
+    "llm_retries_total", "Retried OpenAI calls by pipeline stage.", ("stage",))
+llm_call_seconds = metrics.REGISTRY.histogram(
+    "llm_call_duration_seconds", "OpenAI call latency by pipeline stage.", ("stage",),
+    (0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0))
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def token_counts(usage):
+    """Returns (input_tokens, output_tokens) from an OpenAI `usage` block (dict or SDK object)."""
+    if not usage:
+        return 0, 0
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0
+    return getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0
+
+
+def estimate_cost(model, input_tokens, output_tokens):
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+def _empty_stage():
+    return {
+        "calls": 0,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "images": 0,
+        "retries": 0,
+        "latency_seconds": 0.0,
+        "cost_usd": 0.0,
+    }
+
+
+def merge_summaries(summaries):
+    """Adds up several ledger summaries, e.g. all books of one user."""
+    stages = {}
+    for summary in summaries:
+        for stage, values in (summary or {}).get("stages", {}).items():
+            merged = stages.setdefault(stage, _empty_stage())
+            for key in merged:
+                merged[key] += values.get(key, 0)
+    return {"stages": stages, "totals": _totals(stages)}
+
+
+def _totals(stages):
+    totals = _empty_stage()
+    for values in stages.values():
+        for key in totals:
+            totals[key] += values[key]
+    return totals
+
+
+class UsageLedger:
+    def __init__(self, token_budget=TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, model, input_tokens, output_tokens, latency, images=0, retries=0):
+        with self._lock:
+            values = self.stages.setdefault(stage, _empty_stage())
+            values["calls"] += 1
+            values["input_tokens"] += input_tokens
+            values["output_tokens"] += output_tokens
+            values["images"] += images
+            values["retries"] += retries
+            values["latency_seconds"] += latency
+            values["cost_usd"] += estimate_cost(model, input_tokens, output_tokens)
+            used = sum(v["input_tokens"] + v["output_tokens"] for v in self.stages.values())
+
+        if self.token_budget and used > self.token_budget:
+            raise BudgetExceeded(f"Token budget of {self.token_budget} exceeded ({used} tokens used)")
+
+    def summary(self):
+        with self._lock:
+            stages = {stage: dict(values) for stage, values in self.stages.items()}
+        return {"stages": stages, "totals": _totals(stages)}
+
+
+_ledger = ContextVar("usage_ledger", default=None)
+
+
+@contextmanager
+def track(token_budget=TOKEN_BUDGET):
+    ledger = UsageLedger(token_budget)
+    token = _ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _ledger.reset(token)
+
+
+def record_call(stage, model, usage, latency, images=0, retries=0):
+    """
+    Records one OpenAI call. Raises BudgetExceeded when the active ledger goes
+    over its token budget; the call itself is still counted.
+    """
+    input_tokens, output_tokens = token_counts(usage)
+    llm_calls_total.inc(stage, model)
+    llm_tokens_total.inc(stage, model, "input", amount=input_tokens)
+    llm_tokens_total.inc(stage, model, "output", amount=output_tokens)
+    llm_call_seconds.observe(latency, stage)
+    if retries:
+        llm_retries_total.inc(stage, amount=retries)
+
+    ledger = _ledger.get()
+    if ledger is not None:
+        ledger.record(stage, model, input_tokens, output_tokens, latency, images, retries)